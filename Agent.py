@@ -1,40 +1,54 @@
-import os
-import pickle
-
 import arcade
-from random import random, choice
 from Environment import *
+from AgentLogic import ATTACK_EVENT, HIT_EVENT, BLOCK_EVENT
+
+# Sound played for each event of an agent
+EVENT_SOUNDS = {
+    ATTACK_EVENT: "attack_short.mp3",
+    HIT_EVENT: "hit.mp3",
+    BLOCK_EVENT: "block.mp3",
+}
+
+# Sounds are only decoded the first time they are played
+SOUNDS = {}
+
 
-ATTACK_SOUND = arcade.load_sound(f"{SOUNDS_PATH}/attack_short.mp3")
-HIT_SOUND = arcade.load_sound(f"{SOUNDS_PATH}/hit.mp3")
-BLOCK_SOUND = arcade.load_sound(f"{SOUNDS_PATH}/block.mp3")
-JUMP_SOUND = arcade.load_sound(f"{SOUNDS_PATH}/jump.mp3")
+def load_sound(filename):
+    if filename not in SOUNDS:
+        SOUNDS[filename] = arcade.load_sound(f"{SOUNDS_PATH}/{filename}")
+    return SOUNDS[filename]
+
+
+# Texture pairs loaded by every agent of the process
+TEXTURE_PAIRS = {}
 
 
 def load_texture_pair(filename):
     """
     Load a texture pair, with the second being a mirror image.
+    The pairs are cached, so that new agents do not load their textures again.
     """
-    return [
-        arcade.load_texture(filename),
-        arcade.load_texture(filename, flipped_horizontally=True),
-    ]
+    if filename not in TEXTURE_PAIRS:
+        TEXTURE_PAIRS[filename] = [
+            arcade.load_texture(filename),
+            arcade.load_texture(filename, flipped_horizontally=True),
+        ]
+    return TEXTURE_PAIRS[filename]
 
 
 class Agent(arcade.Sprite):
+    """
+    Sprite of an agent, observing the AgentLogic which fights and learns.
+    """
 
-    def __init__(self, environment, health, position, sprites, face_direction, qtable, agent_number):
+    def __init__(self, logic, sprites, face_direction):
         super().__init__()
 
+        self.__logic = logic
+        self.__logic.listener = self.on_agent_event
         self.character_face_direction = face_direction
-        self.__state = position
-        self.__score = 0
-        self.__last_action = None
-        self.__qtable = {}
-        self.__health = health
-        self.__actual_action = None
+        self.__face_direction = face_direction
         self.__health_bar = arcade.SpriteList(use_spatial_hash=True)
-        self.__agent_number = agent_number
 
         self.__sprites = sprites
 
@@ -45,16 +59,10 @@ class Agent(arcade.Sprite):
         self.__cur_dead_texture = 0
         self.__change_x = 0
         self.__change_y = 0
-        self.__exploration = 1.0
         self.scale = CHARACTER_SCALING
 
         # Track our state
         self.__is_on_ladder = False
-        self.__is_attacking = False
-        self.__is_touched = False
-        self.__is_blocking = False
-        self.__is_dead = False
-        self.__is_alive = True
         self.__is_down = False
 
         self.walk_textures = []
@@ -70,22 +78,6 @@ class Agent(arcade.Sprite):
         # Set up sprites animations for the agent
         self.set_up_agent_sprites()
 
-        # QTable initialization
-        if qtable is None:
-            if os.path.isfile('../qtable_agent_' + str(self.agent_number) + '.dat'):
-                self.load_qtable('../qtable_agent_' + str(self.agent_number))
-            else:
-                for s in environment.states:
-                    self.__qtable[s] = {}
-                    for a in ACTIONS:
-                        self.__qtable[s][a] = {}
-                        for s2 in environment.states:
-                            self.__qtable[s][a][s2] = {}
-                            for a2 in ACTIONS:
-                                self.__qtable[s][a][s2][a2] = 0.0
-        else:
-            self.__qtable = qtable
-
     def set_up_agent_sprites(self):
         # Load textures for walking
         for i in range(1, 10):
@@ -106,68 +98,26 @@ class Agent(arcade.Sprite):
             self.dead_textures.append(dead_texture)
 
         # Set the initial texture
-        if not self.__is_attacking:
+        if not self.is_attacking:
             self.texture = self.idle_texture_pair[0]
 
-    def update_ia(self, action, new_state, opponent, reward):
-        # QTable update
-        # Q(s, a) <- Q(s, a) + learning_rate * [reward + discount_factor * max(qtable[a]) - Q(s, a)]
-        maxQ = 0.0
-        # max of qtable
-        for a in ACTIONS:
-            if opponent.last_action is not None:
-                if self.__qtable[new_state][a][opponent.state][opponent.last_action] > maxQ:
-                    maxQ = self.__qtable[new_state][a][opponent.state][opponent.last_action]
-        LEARNING_RATE = 0.8
-        DISCOUNT_FACTOR = 0.8
-
-        if opponent.last_action is not None:
-            self.__qtable[self.__state][action][opponent.state][opponent.last_action] += \
-                LEARNING_RATE * (reward + DISCOUNT_FACTOR * maxQ -
-                                 self.__qtable[self.__state][action][opponent.state][opponent.last_action])
-
-        self.__state = new_state
-        self.__score += reward
-        self.__last_action = self.actual_action
-        self.__actual_action = None
-
-    # Best action who maximise reward
-    def best_action(self, opponent):
-        possible_rewards = self.__qtable[self.__state]
-        best = None
-        if random() < self.__exploration:
-            best = choice(list(possible_rewards.keys()))
-            self.__exploration *= 0.99
-        for a in possible_rewards:
-            if opponent.last_action is None:
-                if best is None or possible_rewards[a][opponent.state][a] > possible_rewards[best][opponent.state][a]:
-                    best = a
-            else:
-                if best is None or possible_rewards[a][opponent.state][opponent.last_action] > \
-                        possible_rewards[best][opponent.state][opponent.last_action]:
-                    best = a
-        self.__actual_action = best
-
-    def attack(self, new_state, target):
-        reward = 0
-        self.__is_attacking = True
-        arcade.play_sound(ATTACK_SOUND)
-        if self.get_distance_between_players(new_state, target.state) == 1:
-            if target.actual_action != BLOCK:
-                target.__is_touched = True
-                target.__health -= 1
-                arcade.play_sound(HIT_SOUND)
-                reward += REWARD_WOUND_TARGET
-            else:
-                target.__is_blocking = True
-                arcade.play_sound(BLOCK_SOUND)
-                reward = REWARD_TOUCH_BLOCKING_TARGET
-        else:
-            reward = REWARD_TOUCH_EMPTY
-        return reward
-
-    def get_distance_between_players(self, state_agent1, state_agent2):
-        return abs(state_agent1[0] - state_agent2[0]) + abs(state_agent1[1] - state_agent2[1])
+    def reset_animation(self):
+        """
+        Restore the animation for a new match of the agent.
+        """
+        self.character_face_direction = self.__face_direction
+        self.__cur_texture = 0
+        self.__cur_attack_texture = 0
+        self.__cur_idle_texture = 0
+        self.__cur_dead_texture = 0
+        self.__change_x = 0
+        self.__change_y = 0
+        self.__is_down = False
+        self.texture = self.idle_texture_pair[0]
+
+    def on_agent_event(self, event):
+        if event in EVENT_SOUNDS:
+            arcade.play_sound(load_sound(EVENT_SOUNDS[event]))
 
     def update_animation(self, delta_time: float = 1 / 60):
 
@@ -186,17 +136,17 @@ class Agent(arcade.Sprite):
             return
 
         # Attacking animation
-        if self.__is_attacking and self.__change_x == 0:
+        if self.is_attacking and self.__change_x == 0:
             self.__cur_attack_texture = 0
             self.__cur_attack_texture += 1
             if self.__cur_attack_texture > 8:
                 self.__cur_attack_texture = 0
-                self.__is_attacking = False
+                self.is_attacking = False
             self.texture = self.attack_textures[self.__cur_attack_texture][
                 self.character_face_direction
             ]
             return
-        elif not self.__is_alive and not self.__is_down and self.__change_x == 0:
+        elif not self.is_alive and not self.__is_down and self.__change_x == 0:
             self.__cur_dead_texture += 1
             if self.__cur_dead_texture > 10:
                 self.__is_down = True
@@ -205,7 +155,7 @@ class Agent(arcade.Sprite):
             ]
             return
         # Idle animation
-        elif self.__change_x == 0 and self.__is_alive:
+        elif self.__change_x == 0 and self.is_alive:
             self.__cur_idle_texture += 1
             if self.__cur_idle_texture > 14:
                 self.__cur_idle_texture = 0
@@ -223,103 +173,73 @@ class Agent(arcade.Sprite):
                 self.character_face_direction
             ]
 
-    def save_qtable(self, file_name):
-        with open(file_name + '.dat', 'wb') as f:
-            pickle.dump(self.qtable, f)
-
-    def load_qtable(self, file_name):
-        with open(file_name + '.dat', 'rb') as f:
-            self.qtable = pickle.load(f)
-
     @property
-    def score(self):
-        return self.__score
+    def logic(self):
+        return self.__logic
 
-    def _get_qtable(self):
-        return self.__qtable
+    def _get_health_bar(self):
+        return self.__health_bar
 
-    def _set_qtable(self, qtable):
-        self.__qtable = qtable
+    def _set_health_bar(self, health_bar):
+        self.__health_bar = health_bar
 
-    def _get_agent_number(self):
-        return self.__agent_number
+    health_bar = property(_get_health_bar, _set_health_bar)
 
-    def _set_agent_number(self, agent_number):
-        self.__agent_number = agent_number
+    # A muted sprite stops observing its logic, which then plays its events without any sound
+    def _get_muted(self):
+        return self.__logic.listener is None
 
-    agent_number = property(_get_agent_number, _set_agent_number)
+    def _set_muted(self, muted):
+        self.__logic.listener = None if muted else self.on_agent_event
 
-    qtable = property(_get_qtable, _set_qtable)
+    muted = property(_get_muted, _set_muted)
 
-    def reset(self, environment):
-        self.__state = environment.start
+    # State of the agent, read from its logic
 
     @property
-    def last_action(self):
-        return self.__last_action
-
-    def _get_health(self):
-        return self.__health
+    def state(self):
+        return self.__logic.state
 
-    def _set_health(self, health):
-        self.__health = health
+    @property
+    def score(self):
+        return self.__logic.score
 
-    health = property(_get_health, _set_health)
+    @property
+    def health(self):
+        return self.__logic.health
 
-    def _get_is_alive(self):
-        return self.__is_alive
+    @property
+    def is_alive(self):
+        return self.__logic.is_alive
 
-    def _set_is_alive(self, is_alive):
-        self.__is_alive = is_alive
+    @property
+    def last_action(self):
+        return self.__logic.last_action
 
-    is_alive = property(_get_is_alive, _set_is_alive)
+    @property
+    def actual_action(self):
+        return self.__logic.actual_action
 
+    def _get_is_attacking(self):
+        return self.__logic.is_attacking
 
     def _set_is_attacking(self, is_attacking):
-        self.__is_attacking = is_attacking
-
-    def _get_is_attacking(self):
-        return self.__is_attacking
+        self.__logic.is_attacking = is_attacking
 
     is_attacking = property(_get_is_attacking, _set_is_attacking)
 
-    def _set_is_blocking(self, is_blocking):
-        self.__is_blocking = is_blocking
-
     def _get_is_blocking(self):
-        return self.__is_blocking
-
-    is_blocking = property(_get_is_blocking, _set_is_blocking)
-
-    def _get_health_bar(self):
-        return self.__health_bar
+        return self.__logic.is_blocking
 
-    def _set_health_bar(self, health_bar):
-        self.__health_bar = health_bar
-
-    health_bar = property(_get_health_bar, _set_health_bar)
+    def _set_is_blocking(self, is_blocking):
+        self.__logic.is_blocking = is_blocking
 
-    def _get_state(self):
-        return self.__state
+    is_blocking = property(_get_is_blocking, _set_is_blocking)
 
     def _get_is_touched(self):
-        return self.__is_touched
+        return self.__logic.is_touched
 
     def _set_is_touched(self, is_touched):
-        self.__is_touched = is_touched
+        self.__logic.is_touched = is_touched
 
     is_touched = property(_get_is_touched, _set_is_touched)
-
-    def _set_state(self, state):
-        self.__state = state
-
-    state = property(_get_state, _set_state)
-
-    def _get_actual_action(self):
-        return self.__actual_action
-
-    def _set_actual_action(self, actual_action):
-        self.__actual_action = actual_action
-
-    actual_action = property(_get_actual_action, _set_actual_action)
-
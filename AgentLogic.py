@@ -0,0 +1,269 @@
+import os
+
+from Environment import *
+from Learner import QLearning
+from QTable import QTable
+
+# Events sent to the listener of an agent
+ATTACK_EVENT = 'attack'
+HIT_EVENT = 'hit'
+BLOCK_EVENT = 'block'
+
+
+class AgentLogic:
+    """
+    Game logic and learning of an agent, without any rendering.
+    The sprite of the agent (Agent) observes it through its listener.
+    """
+
+    __slots__ = ('__cell', '__encoder', '__distances', '__score', '__last_action', '__learner', '__health',
+                 '__max_health', '__actual_action', '__agent_number', '__learning',
+                 '__is_attacking', '__is_touched', '__is_blocking', '__is_alive', '__listener')
+
+    def __init__(self, environment, health, position, qtable, agent_number, learning=True, sparse=None, rng=None,
+                 learner=QLearning, qtable_path=QTABLE_PATH):
+        # Integer cell of the agent, the arena states are only used for the rendering
+        self.__encoder = environment.encoder
+        self.__cell = self.__encoder.cell_index(position)
+        self.__distances = environment.distances
+        self.__score = 0
+        self.__last_action = None
+        self.__health = health
+        self.__max_health = health
+        self.__actual_action = None
+        self.__agent_number = agent_number
+        # Agents which are not learning only replay their qtable
+        self.__learning = learning
+        # Called with the events of the agent, to play the sounds for instance
+        self.__listener = None
+
+        # Track our state
+        self.__is_attacking = False
+        self.__is_touched = False
+        self.__is_blocking = False
+        self.__is_alive = True
+
+        # QTable initialization, learner builds the policy and the updates of the agent (see Learner.py)
+        # from the qtable and the random generator of its exploration (see Rng.py).
+        # Without qtable, the one saved under qtable_path is resumed if it exists (none if qtable_path is None)
+        if qtable is None:
+            self.__learner = learner(QTable.from_environment(environment, sparse), rng)
+            if qtable_path is not None and os.path.isfile(qtable_path + str(self.agent_number) + QTABLE_EXTENSION):
+                self.load_qtable(qtable_path + str(self.agent_number))
+        else:
+            self.__learner = learner(qtable, rng)
+
+    def reset_for_new_match(self, position):
+        """
+        Restore the agent for a new match, keeping its qtable.
+        """
+        self.__cell = self.__encoder.cell_index(position)
+        self.__score = 0
+        self.__last_action = None
+        self.__actual_action = None
+        self.__health = self.__max_health
+        self.__learner.reset()
+
+        self.__is_attacking = False
+        self.__is_touched = False
+        self.__is_blocking = False
+        self.__is_alive = True
+
+    def update_ia(self, action, new_cell, opponent, reward):
+        # QTable update, by the learner
+        if opponent.last_action is not None and self.__learning:
+            encoder = self.__encoder
+            opponent_action = encoder.action_index(opponent.last_action)
+            self.__learner.update(
+                encoder.encode(self.__cell, opponent.cell, opponent_action, self.__health, opponent.health),
+                encoder.action_index(action), reward,
+                encoder.encode(new_cell, opponent.cell, opponent_action, self.__health, opponent.health))
+
+        self.__cell = new_cell
+        self.__score += reward
+        self.__last_action = self.actual_action
+        self.__actual_action = None
+
+    # Best action who maximise reward
+    def best_action(self, opponent):
+        learner = self.__learner
+        encoder = self.__encoder
+        if opponent.last_action is None:
+            best = learner.explore() if self.__learning else None
+            if best is None or learner.explore_ties_only:
+                for a in range(len(encoder.actions)):
+                    row = learner.values(encoder.encode(self.__cell, opponent.cell, a, self.__health, opponent.health))
+                    if best is None or row[a] > row[best]:
+                        best = a
+        else:
+            best = learner.select_action(encoder.encode(self.__cell, opponent.cell,
+                                                        encoder.action_index(opponent.last_action),
+                                                        self.__health, opponent.health), self.__learning)
+        if self.__learning:
+            learner.selected(best)
+        self.__actual_action = encoder.actions[best]
+
+    def attack(self, new_cell, target):
+        reward = 0
+        self.__is_attacking = True
+        self.notify(ATTACK_EVENT)
+        if self.get_distance_between_players(new_cell, target.cell) == 1:
+            if target.actual_action != BLOCK:
+                target.__is_touched = True
+                target.__health -= 1
+                self.notify(HIT_EVENT)
+                reward += REWARD_WOUND_TARGET
+            else:
+                target.__is_blocking = True
+                self.notify(BLOCK_EVENT)
+                reward = REWARD_TOUCH_BLOCKING_TARGET
+        else:
+            reward = REWARD_TOUCH_EMPTY
+        return reward
+
+    def replay_step(self, cell, action, health, reward):
+        """
+        Apply a recorded step (see Replay.py) instead of playing.
+        """
+        self.__cell = cell
+        self.__health = health
+        self.__is_alive = health > 0
+        self.__score += reward
+        self.__last_action = action
+        self.__actual_action = None
+        self.__is_attacking = action == PUNCH
+        if self.__is_attacking:
+            self.notify(ATTACK_EVENT)
+        self.__is_blocking = action == BLOCK
+        if self.__is_blocking:
+            self.notify(BLOCK_EVENT)
+
+    def notify(self, event):
+        if self.__listener is not None:
+            self.__listener(event)
+
+    def get_distance_between_players(self, cell_agent1, cell_agent2):
+        return self.__distances[cell_agent1][cell_agent2]
+
+    def save_qtable(self, file_name):
+        self.__learner.save(file_name)
+
+    # Pickled qtables are converted with QTableConverter.py, a qtable of another arena raises a ValueError
+    def load_qtable(self, file_name):
+        self.__learner.load(file_name, self.__encoder)
+
+    def _get_learning(self):
+        return self.__learning
+
+    def _set_learning(self, learning):
+        self.__learning = learning
+
+    learning = property(_get_learning, _set_learning)
+
+    def _get_listener(self):
+        return self.__listener
+
+    def _set_listener(self, listener):
+        self.__listener = listener
+
+    listener = property(_get_listener, _set_listener)
+
+    @property
+    def score(self):
+        return self.__score
+
+    @property
+    def exploration(self):
+        return self.__learner.exploration
+
+    @property
+    def learner(self):
+        return self.__learner
+
+    @property
+    def q_delta(self):
+        return self.__learner.q_delta
+
+    def _get_qtable(self):
+        return self.__learner.qtable
+
+    def _set_qtable(self, qtable):
+        self.__learner.qtable = qtable
+
+    def _get_agent_number(self):
+        return self.__agent_number
+
+    def _set_agent_number(self, agent_number):
+        self.__agent_number = agent_number
+
+    agent_number = property(_get_agent_number, _set_agent_number)
+
+    qtable = property(_get_qtable, _set_qtable)
+
+    @property
+    def last_action(self):
+        return self.__last_action
+
+    def _get_health(self):
+        return self.__health
+
+    def _set_health(self, health):
+        self.__health = health
+
+    health = property(_get_health, _set_health)
+
+    def _get_is_alive(self):
+        return self.__is_alive
+
+    def _set_is_alive(self, is_alive):
+        self.__is_alive = is_alive
+
+    is_alive = property(_get_is_alive, _set_is_alive)
+
+    def _set_is_attacking(self, is_attacking):
+        self.__is_attacking = is_attacking
+
+    def _get_is_attacking(self):
+        return self.__is_attacking
+
+    is_attacking = property(_get_is_attacking, _set_is_attacking)
+
+    def _set_is_blocking(self, is_blocking):
+        self.__is_blocking = is_blocking
+
+    def _get_is_blocking(self):
+        return self.__is_blocking
+
+    is_blocking = property(_get_is_blocking, _set_is_blocking)
+
+    def _get_state(self):
+        return self.__encoder.cells[self.__cell]
+
+    def _get_is_touched(self):
+        return self.__is_touched
+
+    def _set_is_touched(self, is_touched):
+        self.__is_touched = is_touched
+
+    is_touched = property(_get_is_touched, _set_is_touched)
+
+    def _set_state(self, state):
+        self.__cell = self.__encoder.cell_index(state)
+
+    state = property(_get_state, _set_state)
+
+    def _get_cell(self):
+        return self.__cell
+
+    def _set_cell(self, cell):
+        self.__cell = cell
+
+    cell = property(_get_cell, _set_cell)
+
+    def _get_actual_action(self):
+        return self.__actual_action
+
+    def _set_actual_action(self, actual_action):
+        self.__actual_action = actual_action
+
+    actual_action = property(_get_actual_action, _set_actual_action)
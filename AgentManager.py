@@ -1,9 +1,19 @@
 from Environment import *
-from Agent import *
+from AgentLogic import AgentLogic
+from Learner import learner_factory
 
 class AgentManager:
-    def __init__(self, environment, population, health):
+    def __init__(self, environment, population, health, learning=True, sparse=None, rngs=None, learner=None,
+                 qtable_path=QTABLE_PATH):
         self.__environment = environment
+        # random generator of every agent, kept by the next agents
+        self.__rngs = rngs if rngs is not None else [None] * population
+        # builds the learner of every agent, see Learner.learner_factory
+        self.__learner = learner if learner is not None else learner_factory()
+        self.__learning = learning
+        # prefix of the qtables the agents resume from
+        self.__qtable_path = qtable_path
+        self.__sparse = sparse
         self.__population = population
         self.__player_1_has_priority = PLAYER_1_HAS_PRIORITY
         self.__health = health
@@ -19,12 +29,15 @@ class AgentManager:
         self.__agents.clear()
         for i in range(self.__population):
             if i % 2 == 0:
-                self.__agents.append(Agent(self.__environment, MAX_HP,
-                                           self.__environment.players_pos[i], 'male', RIGHT_FACING, qtable1, i))
+                self.__agents.append(AgentLogic(self.__environment, MAX_HP,
+                                                self.__environment.players_pos[i], qtable1, i, self.__learning,
+                                                self.__sparse, self.__rngs[i], self.__learner,
+                                                self.__qtable_path))
             else:
-                self.__agents.append(
-                    Agent(self.__environment, MAX_HP,
-                          self.__environment.players_pos[i], 'female', LEFT_FACING, qtable2, i))
+                self.__agents.append(AgentLogic(self.__environment, MAX_HP,
+                                                self.__environment.players_pos[i], qtable2, i, self.__learning,
+                                                self.__sparse, self.__rngs[i], self.__learner,
+                                                self.__qtable_path))
         self.__environment.players = self.__agents
 
     # Verify if all agents are alive
@@ -46,13 +59,18 @@ class AgentManager:
 
     agents = property(_get_agents, _set_agents)
 
+    @property
+    def learners(self):
+        return [agent.learner for agent in self.__agents]
+
     @property
     def get_agents_health(self):
         return self.__health
 
     def reset(self):
         # for each agent, reset the health and the state
-        self.set_new_agents()
+        for i in range(len(self.__agents)):
+            self.__agents[i].reset_for_new_match(self.__environment.players_pos[i])
 
     def _get_player_1_has_priority(self):
         return self.__player_1_has_priority
@@ -0,0 +1,73 @@
+import numpy as np
+
+from Environment import *
+
+
+class ArenaTables:
+    """
+    Parsed arena and the lookup tables of its rules, computed once.
+    Cells are the indices of the arena states in reading order and actions the indices in ACTIONS.
+    """
+
+    def __init__(self, text_arena, actions=ACTIONS):
+        self.__states = {}
+        self.__players_pos = []
+        lines = list(map(lambda x: x.strip(), text_arena.strip().split('\n')))
+        for row in range(len(lines)):
+            for col in range(len(lines[row])):
+                self.__states[(row, col)] = lines[row][col]
+                if lines[row][col] == PLAYER:
+                    self.__players_pos.append((row, col))
+        cells = list(self.__states)
+        cell_indices = {state: i for i, state in enumerate(cells)}
+        n_cells = len(cells)
+
+        # next cell for every (cell, action), -1 when leaving the arena
+        self.__next_cell = np.empty((n_cells, len(actions)), dtype=np.int32)
+        for i, (row, col) in enumerate(cells):
+            for a, action in enumerate(actions):
+                if action == LEFT:
+                    self.__next_cell[i, a] = cell_indices.get((row, col - 1), -1)
+                elif action == RIGHT:
+                    self.__next_cell[i, a] = cell_indices.get((row, col + 1), -1)
+                else:
+                    self.__next_cell[i, a] = i
+        self.__is_wall = np.array([self.__states[state] == WALL for state in cells])
+        # players on two neighbour cells of the same row can touch each other
+        self.__is_near = np.zeros((n_cells, n_cells), dtype=bool)
+        for i, (row, col) in enumerate(cells):
+            for neighbour in [(row, col - 1), (row, col + 1)]:
+                if neighbour in cell_indices:
+                    self.__is_near[i, cell_indices[neighbour]] = True
+        # manhattan distance between every two cells
+        positions = np.array(cells, dtype=np.int32).reshape(-1, 2)
+        self.__distances = np.abs(positions[:, None, :] - positions[None, :, :]).sum(axis=2)
+        self.__is_moving = np.array([action in MOVING_ACTIONS for action in actions])
+
+    @property
+    def states(self):
+        return self.__states
+
+    @property
+    def players_pos(self):
+        return self.__players_pos
+
+    @property
+    def next_cell(self):
+        return self.__next_cell
+
+    @property
+    def is_wall(self):
+        return self.__is_wall
+
+    @property
+    def is_near(self):
+        return self.__is_near
+
+    @property
+    def distances(self):
+        return self.__distances
+
+    @property
+    def is_moving(self):
+        return self.__is_moving
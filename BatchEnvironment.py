@@ -0,0 +1,185 @@
+import numpy as np
+
+from Environment import *
+from StateEncoder import StateEncoder
+from ArenaTables import ArenaTables
+
+
+class BatchEnvironment:
+    """
+    N independent fights between two players simulated in lockstep.
+    Cells are the indices of the arena states (the same as the StateEncoder cells) and
+    actions are indices in ACTIONS, -1 standing for no action.
+    The rules are the ones of GameEnvironment.apply applied through AgentManager.apply_actions:
+    the moving actions are applied first, then the others, each in priority order.
+    """
+
+    def __init__(self, text_arena, matches, max_iterations=MAX_ITERATIONS,
+                 player_1_has_priority=PLAYER_1_HAS_PRIORITY, health_buckets=HEALTH_BUCKETS):
+        tables = ArenaTables(text_arena)
+        self.__states = list(tables.states)
+        self.__encoder = StateEncoder(self.__states, ACTIONS, health_buckets)
+        self.__matches = matches
+        self.__max_iterations = max_iterations
+        self.__starts = np.array([self.__encoder.cell_index(pos) for pos in tables.players_pos[:2]], dtype=np.int32)
+        self.__next_cell = tables.next_cell
+        self.__is_wall = tables.is_wall
+        self.__is_near = tables.is_near
+        self.__is_moving = tables.is_moving
+
+        self.__cells = np.empty((matches, 2), dtype=np.int32)
+        self.__health = np.empty((matches, 2), dtype=np.int32)
+        self.__alive = np.empty((matches, 2), dtype=bool)
+        self.__last_actions = np.empty((matches, 2), dtype=np.int8)
+        self.__scores = np.empty((matches, 2), dtype=np.int64)
+        self.__iterations = np.empty(matches, dtype=np.int64)
+        self.__player_1_has_priority = np.full(matches, player_1_has_priority)
+        self.reset()
+
+    def reset(self, matches=None):
+        if matches is None:
+            matches = slice(None)
+        self.__cells[matches] = self.__starts
+        self.__health[matches] = MAX_HP
+        self.__alive[matches] = True
+        self.__last_actions[matches] = -1
+        self.__scores[matches] = 0
+        self.__iterations[matches] = 0
+
+    def reset_done(self):
+        """
+        Reset the finished fights and return their indices.
+        """
+        done = np.flatnonzero(self.done)
+        self.reset(done)
+        return done
+
+    # Encoded observation of a player in every fight, the qtable rows of its next actions
+    def observe(self, player):
+        opponent = 1 - player
+        last_actions = self.__last_actions[:, opponent].astype(np.int64)
+        last_actions[last_actions < 0] = self.__encoder.no_action
+        return self.__encoder.encode(self.__cells[:, player].astype(np.int64), self.__cells[:, opponent], last_actions,
+                                     self.__health[:, player], self.__health[:, opponent])
+
+    def step(self, actions):
+        """
+        Apply the actions, an array of shape (matches, 2), of both players of every running fight.
+        Return the transitions in the order they were applied, as a dict of arrays
+        (match, player, state, action, opponent_state, opponent_action, reward, new_state) where
+        opponent_action is the last action of the opponent when the transition was applied.
+        """
+        actions = np.asarray(actions)
+        running = ~self.done
+        first = np.where(self.__player_1_has_priority, 0, 1)
+        moving = self.__is_moving[actions]
+        # actions still waiting to be applied, their target can block with them
+        pending = running[:, None].repeat(2, axis=1)
+
+        transitions = []
+        for moving_phase in [True, False]:
+            for player in [first, 1 - first]:
+                matches = np.flatnonzero(running & (moving[np.arange(self.__matches), player] == moving_phase))
+                if len(matches):
+                    transitions.append(self.__apply(matches, player[matches], actions, pending))
+
+        self.__iterations[running] += 1
+        keys = ['match', 'player', 'state', 'action', 'opponent_state', 'opponent_action', 'reward', 'new_state']
+        if not transitions:
+            return {key: np.empty(0, dtype=np.int64) for key in keys}
+        return {key: np.concatenate([t[i] for t in transitions]) for i, key in enumerate(keys)}
+
+    def __apply(self, matches, players, actions, pending):
+        opponents = 1 - players
+        action = actions[matches, players]
+        state = self.__cells[matches, players]
+        opponent_state = self.__cells[matches, opponents]
+        opponent_action = self.__last_actions[matches, opponents].copy()
+
+        new_state = self.__next_cell[state, action]
+        inside = new_state >= 0
+        new_state = np.where(inside, new_state, state)
+        alive = self.__alive[matches, players]
+        near = self.__is_near[state, opponent_state]
+
+        reward = np.full(len(matches), REWARD_EMPTY, dtype=np.int64)
+        out = ~inside | self.__is_wall[new_state] | (~self.__is_moving[action] & (state == opponent_state))
+        punch = alive & ~out & (action == ACTIONS.index(PUNCH))
+        block = alive & ~out & (action == ACTIONS.index(BLOCK))
+        reward[out] = REWARD_OUT
+        reward[punch] = REWARD_TOUCH_EMPTY
+
+        # the block of the target only counts if its action is not applied yet
+        attack = punch & near
+        target_blocks = pending[matches, opponents] & (actions[matches, opponents] == ACTIONS.index(BLOCK))
+        hit = attack & ~target_blocks
+        reward[attack & target_blocks] = REWARD_TOUCH_BLOCKING_TARGET
+        reward[hit] = REWARD_WOUND_TARGET
+        self.__health[matches[hit], opponents[hit]] -= 1
+        killed = hit & (self.__health[matches, opponents] <= 0)
+        reward[killed] += REWARD_KILL_TARGET
+        self.__alive[matches[killed], opponents[killed]] = False
+
+        opponent_punches = actions[matches, opponents] == ACTIONS.index(PUNCH)
+        reward[block] = np.where(opponent_punches & near, REWARD_BLOCK_ATTACK, REWARD_BLOCK)[block]
+
+        # a player killed earlier in this step only gets its death
+        reward[~alive] = REWARD_DEATH
+        new_state = np.where(alive, new_state, state)
+
+        self.__cells[matches, players] = new_state
+        self.__scores[matches, players] += reward
+        self.__last_actions[matches, players] = action
+        pending[matches, players] = False
+        return matches, players, state, action, opponent_state, opponent_action, reward, new_state
+
+    @property
+    def done(self):
+        over = self.__alive.sum(axis=1) <= 1
+        if self.__max_iterations is not None:
+            over |= self.__iterations >= self.__max_iterations
+        return over
+
+    @property
+    def encoder(self):
+        return self.__encoder
+
+    @property
+    def matches(self):
+        return self.__matches
+
+    @property
+    def states(self):
+        return self.__states
+
+    @property
+    def cells(self):
+        return self.__cells
+
+    @property
+    def health(self):
+        return self.__health
+
+    @property
+    def alive(self):
+        return self.__alive
+
+    @property
+    def last_actions(self):
+        return self.__last_actions
+
+    @property
+    def scores(self):
+        return self.__scores
+
+    @property
+    def iterations(self):
+        return self.__iterations
+
+    def _get_player_1_has_priority(self):
+        return self.__player_1_has_priority
+
+    def _set_player_1_has_priority(self, value):
+        self.__player_1_has_priority[:] = value
+
+    player_1_priority = property(_get_player_1_has_priority, _set_player_1_has_priority)
@@ -0,0 +1,90 @@
+# Background checkpoints of the qtables
+import queue
+import threading
+
+from Rng import write_rng_state
+
+
+class CheckpointWriter:
+    """
+    Save the qtables every interval generations without blocking the training loop.
+    The training loop only copies the values updated since the last checkpoint; a background
+    thread applies them to its own copy of every qtable and replaces the files atomically.
+    The state of the random generators given with a checkpoint is written to rng_file_name.
+    """
+
+    def __init__(self, file_names, interval, rng_file_name=None):
+        self.__file_names = file_names
+        self.__rng_file_name = rng_file_name
+        self.__interval = interval
+        # qtables of the training loop and the copies written by the thread
+        self.__qtables = [None] * len(file_names)
+        self.__copies = [None] * len(file_names)
+        self.__queue = queue.Queue()
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name="checkpoint-writer", daemon=True)
+        self.__thread.start()
+
+    def checkpoint(self, qtables, generation=None, rng_state=None):
+        """
+        Queue a checkpoint of the qtables, only every interval generations if generation is given.
+        """
+        self.raise_error()
+        if generation is not None and (not self.__interval or generation % self.__interval != 0):
+            return
+        changes = []
+        for i, qtable in enumerate(qtables):
+            if qtable is not self.__qtables[i]:
+                # a new qtable (loaded, merged...) is copied entirely once
+                self.__qtables[i] = qtable
+                qtable.track_changes()
+                qtable.pop_changes()
+                changes.append((i, qtable.copy(), None))
+            else:
+                changes.append((i, None, qtable.pop_changes()))
+        self.__queue.put((changes, rng_state))
+
+    def __run(self):
+        unsaved = False
+        rng_state = None
+        while True:
+            changes = self.__queue.get()
+            try:
+                if changes is not None:
+                    changes, rng_state = changes
+                    for i, copy, qtable_changes in changes:
+                        if copy is not None:
+                            self.__copies[i] = copy
+                        else:
+                            self.__copies[i].apply_changes(qtable_changes)
+                    unsaved = True
+                # only the latest state of the qtables is worth writing
+                if unsaved and (changes is None or self.__queue.empty()):
+                    for copy, file_name in zip(self.__copies, self.__file_names):
+                        copy.save(file_name)
+                    if self.__rng_file_name is not None and rng_state is not None:
+                        write_rng_state(self.__rng_file_name, rng_state)
+                    unsaved = False
+            except Exception as error:
+                self.__error = error
+            if changes is None:
+                return
+
+    def raise_error(self):
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def close(self, qtables=None, rng_state=None):
+        """
+        Write a last checkpoint of the qtables if given, then wait for the thread.
+        """
+        if qtables is not None:
+            self.checkpoint(qtables, rng_state=rng_state)
+        self.__queue.put(None)
+        self.__thread.join()
+        self.raise_error()
+
+    @property
+    def interval(self):
+        return self.__interval
@@ -23,9 +23,29 @@ BLOCK = 'B'
 ACTIONS = [RIGHT, LEFT, PUNCH, BLOCK]
 MOVING_ACTIONS = [RIGHT, LEFT]
 
-# Q_Table evolution of agents in hashmap
-SCORE_TABLES_EVOLUTIONS = {}
-PLT_GENERATION_NUMBER = []
+# Learning of the agents, see Learner.py
+LEARNER = 'qlearning'
+LEARNING_RATE = 0.8
+DISCOUNT_FACTOR = 0.8
+# Exploration is 1 at the start of every match and multiplied by EXPLORATION_DECAY each time an agent explores
+EXPLORATION_DECAY = 0.99
+MIN_EXPLORATION = 0.0
+# Eligibility traces of the 'qlambda' learner: lambda, and the number of traces kept
+TRACE_DECAY = 0.9
+TRACE_LENGTH = 32
+TRACE_MINIMUM = 0.01
+# Experience replay of the 'replay' learner: transitions kept, minibatch size and transitions between two minibatches
+REPLAY_SIZE = 10000
+REPLAY_BATCH = 32
+REPLAY_EVERY = 4
+# Prioritized replay: priorities are errors ** PRIORITY_ALPHA, corrected by weights of exponent PRIORITY_BETA
+PRIORITY_ALPHA = 0.6
+PRIORITY_BETA = 0.4
+
+# Scores of the agents at every generation, see ScoreLog
+SCORE_LOG_PATH = "../scores.csv"
+# Points of the score history kept in memory
+SCORE_HISTORY_SIZE = 1000
 
 PLAYER_1 = '1'
 PLAYER_2 = '2'
@@ -56,6 +76,8 @@ PLAYER_START_X = SPRITE_PIXEL_SIZE * TILE_SCALING
 PLAYER_TWO_START_Y = SPRITE_PIXEL_SIZE * TILE_SCALING * 3
 
 MAX_HP = 10
+# Health levels of each player seen by the agents, 1 to ignore the health
+HEALTH_BUCKETS = 1
 
 # Constants used to track if the player is facing left or right
 RIGHT_FACING = 0
@@ -67,9 +89,26 @@ LAYER_NAME_PLAYER_TWO = "PlayerTwo"
 
 SPRITES_PATH = "./core/asset/sprites/png/"
 
+# Learning steps per rendered frame cycled with the F key, 0 runs as many steps as FRAME_TIME_BUDGET allows
+STEPS_PER_FRAME = [1, 10, 100, 0]
+FRAME_TIME_BUDGET = 0.012
+# Above one step per frame, the window is only redrawn every RENDER_EVERY frames
+RENDER_EVERY = 10
+
 
 # Load sounds
 SOUNDS_PATH = "./core/asset/sounds/"
 
 CHARACTER_SCALING = 0.3
 MAIN_PATH = f"./core/asset/sprites/png/"
+
+
+# Training
+QTABLE_PATH = "../qtable_agent_"
+QTABLE_EXTENSION = ".qtable"
+# Larger qtables are sparse unless asked otherwise
+DENSE_QTABLE_MAX_BYTES = 256 * 1024 ** 2
+SAVE_EVERY = 2
+# Generations between two matches recorded in the episode log
+RECORD_EVERY = 100
+MAX_ITERATIONS = 1000
@@ -0,0 +1,201 @@
+# Greedy round-robin tournaments between saved qtables
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import struct
+import time
+
+import numpy as np
+
+from GameEnvironement import GameEnvironment
+from QTable import QTable, header_encoder
+from Trainer import Trainer
+from Environment import *
+
+# Trainer and qtables of a worker process, kept from one pairing to the next
+_worker_trainer = None
+_worker_qtables = {}
+
+
+def load_checkpoint(file_name):
+    # every worker loads a checkpoint once, for all its pairings
+    if file_name not in _worker_qtables:
+        _worker_qtables[file_name] = QTable.load(file_name)
+    return _worker_qtables[file_name]
+
+
+def play_match(trainer, qtables, player_1_priority):
+    """
+    Play one greedy match between two qtables, the first one playing the first agent.
+    Return the winner (0, 1, or None for a draw), the length and the damage dealt by each agent.
+    """
+    trainer.qtables = qtables
+    agent_manager = trainer.agent_manager
+    agent_manager.player_1_priority = player_1_priority
+    while not trainer.is_generation_over:
+        trainer.step()
+    agents = agent_manager.agents
+    alive = [agent.is_alive for agent in agents]
+    winner = alive.index(True) if alive.count(True) == 1 else None
+    result = (winner, trainer.iteration_counter, MAX_HP - agents[1].health, MAX_HP - agents[0].health)
+    trainer.end_generation()
+    return result
+
+
+def play_pairing(task):
+    """
+    Play the matches between two checkpoints: both on each side, with both priority orders.
+    Return (first, second, winner, length, damage of first, damage of second) for every match.
+    """
+    global _worker_trainer
+    first, second, file_names, arena, max_iterations = task
+    qtables = [load_checkpoint(file_names[first]), load_checkpoint(file_names[second])]
+    if _worker_trainer is None:
+        # the agents only play the checkpoints, no saved qtable is loaded
+        _worker_trainer = Trainer(arena, learning=False, max_iterations=max_iterations, save_every=0,
+                                  qtable_path=None, health_buckets=qtables[0].encoder.health_buckets)
+    results = []
+    for swapped in (False, True):
+        for player_1_priority in (True, False):
+            players = (second, first) if swapped else (first, second)
+            winner, length, damage_0, damage_1 = play_match(
+                _worker_trainer, qtables[::-1] if swapped else qtables, player_1_priority)
+            if winner is not None:
+                winner = players[winner]
+            results.append((players[0], players[1], winner, length, damage_0, damage_1))
+    return results
+
+
+def elo_ratings(matches, players, iterations=1000):
+    """
+    Elo ratings of the players, as the Bradley-Terry model fitted to all the matches (the
+    strengths the Elo updates estimate, without depending on the order of the matches).
+    Draws count as half a win for both, and every pairing gets one more draw so that a player
+    who never wins keeps a finite rating. Ratings are centered on 1500.
+    """
+    wins = np.zeros((players, players))
+    for first, second, winner, *_ in matches:
+        if winner is None:
+            wins[first, second] += 0.5
+            wins[second, first] += 0.5
+        else:
+            wins[winner, second if winner == first else first] += 1
+    games = wins + wins.T
+    played = games > 0
+    wins[played] += 0.5
+    games[played] += 1
+    strengths = np.ones(players)
+    for _ in range(iterations):
+        # minorization-maximization update of the Bradley-Terry strengths
+        denominators = (games / (strengths[:, None] + strengths[None, :])).sum(axis=1)
+        new_strengths = np.where(denominators > 0, wins.sum(axis=1) / np.maximum(denominators, 1e-300), strengths)
+        new_strengths /= np.exp(np.log(new_strengths).mean())
+        if np.allclose(new_strengths, strengths, rtol=1e-10):
+            strengths = new_strengths
+            break
+        strengths = new_strengths
+    ratings = 400 * np.log10(strengths)
+    return (ratings - ratings.mean() + 1500).tolist()
+
+
+def summarize(file_names, matches):
+    """
+    Win rate, draw rate, average match length and damage dealt per match of every checkpoint, and its Elo.
+    """
+    stats = [{'checkpoint': file_name, 'matches': 0, 'wins': 0, 'draws': 0, 'length': 0, 'damage': 0}
+             for file_name in file_names]
+    for first, second, winner, length, damage_first, damage_second in matches:
+        for player, damage in ((first, damage_first), (second, damage_second)):
+            stats[player]['matches'] += 1
+            stats[player]['length'] += length
+            stats[player]['damage'] += damage
+            if winner is None:
+                stats[player]['draws'] += 1
+            elif winner == player:
+                stats[player]['wins'] += 1
+    for player_stats, elo in zip(stats, elo_ratings(matches, len(file_names))):
+        matches_count = max(player_stats['matches'], 1)
+        player_stats['win_rate'] = player_stats['wins'] / matches_count
+        player_stats['draw_rate'] = player_stats['draws'] / matches_count
+        player_stats['average_length'] = player_stats.pop('length') / matches_count
+        player_stats['average_damage'] = player_stats.pop('damage') / matches_count
+        player_stats['elo'] = elo
+    return sorted(stats, key=lambda s: s['elo'], reverse=True)
+
+
+def check_checkpoints(file_names, arena=ARENA):
+    """
+    Read the header of every checkpoint. Return the checkpoints which observe the arena with the
+    health buckets of the first readable one, and the others with the reason they are skipped.
+    """
+    valid, skipped = [], []
+    encoder = None
+    for file_name in file_names:
+        try:
+            header, _ = QTable.read_header(file_name)
+        except (OSError, ValueError, struct.error) as e:
+            skipped.append((file_name, str(e)))
+            continue
+        checkpoint_encoder = header_encoder(header)
+        if encoder is None:
+            encoder = GameEnvironment(arena, checkpoint_encoder.health_buckets).encoder
+        if checkpoint_encoder != encoder:
+            skipped.append((file_name, "saved for another arena, actions or health buckets"))
+        else:
+            valid.append(file_name)
+    return valid, skipped
+
+
+def evaluate(file_names, workers=None, arena=ARENA, max_iterations=MAX_ITERATIONS):
+    """
+    Play a round-robin tournament between the qtable checkpoints, exploration and learning off,
+    every pairing in a pool of workers processes. The greedy agents can avoid each other forever,
+    so max_iterations must be given: matches reaching it are draws. The checkpoints which do not
+    observe the arena are skipped (see check_checkpoints).
+    Return the matches, the summary of every checkpoint played and the skipped checkpoints.
+    """
+    file_names, skipped = check_checkpoints(file_names, arena)
+    tasks = [(first, second, file_names, arena, max_iterations)
+             for first, second in itertools.combinations(range(len(file_names)), 2)]
+    if workers == 1:
+        results = [play_pairing(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(play_pairing, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count()))))
+    matches = [match for result in results for match in result]
+    return matches, summarize(file_names, matches), skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank saved qtables by greedy round-robin tournaments.")
+    parser.add_argument("checkpoints", nargs='+', help="qtable files to evaluate")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of processes playing the matches")
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS,
+                        help="iterations after which a match is a draw")
+    parser.add_argument("--json", help="write the matches and the summary to this JSON file")
+    args = parser.parse_args()
+    if args.max_iterations < 1:
+        parser.error("--max-iterations must be at least 1")
+
+    start = time.perf_counter()
+    matches, summary, skipped = evaluate(args.checkpoints, args.workers, max_iterations=args.max_iterations)
+    elapsed = time.perf_counter() - start
+    for file_name, reason in skipped:
+        print(f"skipped {file_name}: {reason}")
+    if len(summary) < 2:
+        parser.error("at least two checkpoints of the same arena are needed")
+    print(f"{len(matches)} matches between {len(summary)} checkpoints in {elapsed:.2f}s")
+    width = max(len(s['checkpoint']) for s in summary)
+    for s in summary:
+        print(f"{s['checkpoint']:<{width}}  elo {s['elo']:7.1f}  win {s['win_rate']:6.1%}  draw {s['draw_rate']:6.1%}"
+              f"  length {s['average_length']:7.1f}  damage {s['average_damage']:5.2f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'matches': matches, 'summary': summary, 'skipped': skipped}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
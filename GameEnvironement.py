@@ -1,55 +1,68 @@
-import arcade
+import time
 
 from core.utils.Singleton import Singleton
 from Environment import *
+from StateEncoder import StateEncoder
+from ArenaTables import ArenaTables
 
 class GameEnvironment(Singleton):
-    def __init__(self, text_arena):
-        self.__states = {}
-        self.__players_pos = []
+    def __init__(self, text_arena, health_buckets=HEALTH_BUCKETS):
         self.__players = []
+        # Metrics timing the qtable updates, if any
+        self.__metrics = None
 
-        # Environment parsing
-        lines = list(map(lambda x: x.strip(), text_arena.strip().split('\n')))
-        for row in range(len(lines)):
-            for col in range(len(lines[row])):
-                self.__states[(row, col)] = lines[row][col]
-                if lines[row][col] == PLAYER:
-                    self.__players_pos.append((row, col))
+        # Environment parsing, the rules are looked up in tables built once
+        self.__tables = ArenaTables(text_arena)
+        self.__states = self.__tables.states
+        self.__players_pos = self.__tables.players_pos.copy()
         self.__players_pos_start = self.__players_pos.copy()
-
-    def attack_players(self, agent, new_state):
+        # agents observe the arena through integer cells and observations
+        self.__encoder = StateEncoder(self.__states, ACTIONS, health_buckets)
+        # plain lists are faster than numpy arrays for the lookups of a single agent
+        self.__next_cell = self.__tables.next_cell.tolist()
+        self.__is_wall = self.__tables.is_wall.tolist()
+        self.__is_near = self.__tables.is_near.tolist()
+        self.__distances = self.__tables.distances.tolist()
+
+    def attack_players(self, agent, new_cell):
         reward = 0
         for target in self.players:
-            if target.state != new_state:
-                reward = agent.attack(new_state, target)
+            if target.cell != new_cell:
+                reward = agent.attack(new_cell, target)
                 if target.health <= 0:
                     reward += REWARD_KILL_TARGET
                     target.is_alive = False
         return reward
 
-    def is_near_players(self, state):
-        if state[1] < len(ARENA) - 1:
-            if (state[0], state[1] + 1) in self.get_players_state:
-                return True
-        if state[1] >= 1:
-            if (state[0], state[1] - 1) in self.get_players_state:
+    def is_near_players(self, cell):
+        is_near = self.__is_near[cell]
+        for player in self.__players:
+            if is_near[player.cell]:
                 return True
         return False
 
+    # number of players on a cell
+    def count_players(self, cell):
+        count = 0
+        for player in self.__players:
+            if player.cell == cell:
+                count += 1
+        return count
+
+    # state reached with the action, None when leaving the arena
     def moving_agent(self, state, action):
-        if action == LEFT:
-            new_state = (state[0], state[1] - 1)
-        elif action == RIGHT:
-            new_state = (state[0], state[1] + 1)
-        else:
-            new_state = state
-        return new_state
+        new_cell = self.__next_cell[self.__encoder.cell_index(state)][self.__encoder.action_index(action)]
+        if new_cell < 0:
+            return None
+        return self.__encoder.cells[new_cell]
 
     # fetch agent at position
     def get_agent(self, state):
+        if state not in self.__states:
+            return None
+        cell = self.__encoder.cell_index(state)
         for agent in self.__players:
-            if agent.state == state:
+            if agent.cell == cell:
                 return agent
 
     def other_players_state(self, new_state):
@@ -63,44 +76,71 @@ class GameEnvironment(Singleton):
     # On met à jour l'état de l'agent, on lui donne sa récompense
     def apply(self, agent, opponent):
         reward = 0
-        state = agent.state
+        cell = agent.cell
         action = agent.actual_action
         if not agent.is_alive:
             reward = REWARD_DEATH
         else:
-            new_state = self.moving_agent(state, action)
+            new_cell = self.__next_cell[cell][self.__encoder.action_index(action)]
             # Calcul recompense agent et lui transmettre
-            if new_state in self.__states:
-                if self.__states[new_state] in [WALL] or new_state[1] > len(ARENA) or new_state[1] < 0:
+            if new_cell >= 0:
+                if self.__is_wall[new_cell]:
                     reward = REWARD_OUT
-                elif new_state in self.other_players_state(new_state):
+                elif self.count_players(new_cell) > 1:
+                    # another player is already on the cell
                     reward = REWARD_OUT
-                elif action == PUNCH and self.is_near_players(state):
-                    reward = self.attack_players(agent, new_state)
+                elif action == PUNCH and self.is_near_players(cell):
+                    reward = self.attack_players(agent, new_cell)
                 elif action == PUNCH:
                     reward = REWARD_TOUCH_EMPTY
                 elif action == BLOCK:
                     reward = self.do_action_bloc(agent, opponent)
                 else:
                     reward = REWARD_EMPTY
-                state = new_state
+                cell = new_cell
             else:
                 reward = REWARD_OUT
         # print(f"action: {action}, reward: {reward}, is alive: {agent.is_alive}")
-        agent.update_ia(action, state, opponent, reward)
+        if self.__metrics is None:
+            agent.update_ia(action, cell, opponent, reward)
+        else:
+            start = time.perf_counter()
+            agent.update_ia(action, cell, opponent, reward)
+            self.__metrics.add_time('update', time.perf_counter() - start)
         return reward
 
     def do_action_bloc(self, agent, opponent):
         if opponent.actual_action is not None:
-            if opponent.actual_action == PUNCH and self.is_near_players(opponent.state):
+            if opponent.actual_action == PUNCH and self.is_near_players(opponent.cell):
                 return REWARD_BLOCK_ATTACK
             else:
                 return REWARD_BLOCK
-        elif opponent.last_action == PUNCH and self.is_near_players(opponent.state):
+        elif opponent.last_action == PUNCH and self.is_near_players(opponent.cell):
             return REWARD_BLOCK_ATTACK
         else:
             return REWARD_BLOCK
 
+    def _get_metrics(self):
+        return self.__metrics
+
+    def _set_metrics(self, metrics):
+        self.__metrics = metrics
+
+    metrics = property(_get_metrics, _set_metrics)
+
+    @property
+    def tables(self):
+        return self.__tables
+
+    # distances[cell][other_cell], the manhattan distance between two cells
+    @property
+    def distances(self):
+        return self.__distances
+
+    @property
+    def encoder(self):
+        return self.__encoder
+
     @property
     def players_pos(self):
         return self.__players_pos
@@ -0,0 +1,485 @@
+# Learning algorithms of the agents: how they pick their actions and update their qtable
+import os
+import random
+
+import numpy as np
+
+from Environment import *
+from QTable import QTable
+from ReplayBuffer import ReplayBuffer
+
+
+def load_qtable(file_name, encoder=None):
+    qtable = QTable.load(file_name)
+    if encoder is not None and qtable.encoder != encoder:
+        raise ValueError(f"{file_name} was saved for another arena, actions or health buckets "
+                         f"({qtable.encoder.observations} observations instead of {encoder.observations})")
+    return qtable
+
+
+class ExponentialEpsilon:
+    """
+    Exploration starting at start every match and multiplied by decay each time the agent
+    explores (at every action if per_explore is False), never below minimum.
+    """
+
+    def __init__(self, start=1.0, decay=EXPLORATION_DECAY, minimum=MIN_EXPLORATION, per_explore=True):
+        self.__start = start
+        self.__decay = decay
+        self.__minimum = minimum
+        self.__per_explore = per_explore
+        self.__value = start
+
+    def reset(self):
+        self.__value = self.__start
+
+    def step(self, explored):
+        if explored or not self.__per_explore:
+            self.__value = max(self.__minimum, self.__value * self.__decay)
+
+    @property
+    def value(self):
+        return self.__value
+
+
+class LinearEpsilon:
+    """
+    Exploration going from start to end over the first steps actions of every match.
+    """
+
+    def __init__(self, start=1.0, end=MIN_EXPLORATION, steps=1000):
+        self.__start = start
+        self.__end = end
+        self.__steps = steps
+        self.__step = 0
+
+    def reset(self):
+        self.__step = 0
+
+    def step(self, explored):
+        self.__step += 1
+
+    @property
+    def value(self):
+        if self.__step >= self.__steps:
+            return self.__end
+        return self.__start + (self.__end - self.__start) * self.__step / self.__steps
+
+
+class ConstantEpsilon:
+    def __init__(self, epsilon):
+        self.__epsilon = epsilon
+
+    def reset(self):
+        pass
+
+    def step(self, explored):
+        pass
+
+    @property
+    def value(self):
+        return self.__epsilon
+
+
+class Learner:
+    """
+    Policy and update rule of an agent on its qtable, observations and actions being the
+    integer indices of the StateEncoder. The agent calls select_action (or explore and values)
+    to play, selected with the action it plays, update after every transition and reset at
+    the start of every match. explore_ties_only keeps the exploration of the first versions,
+    where an explored action was only played when it was as good as the greedy one.
+    """
+
+    def __init__(self, qtable, learning_rate=LEARNING_RATE, discount_factor=DISCOUNT_FACTOR, epsilon=None, rng=None,
+                 explore_ties_only=False):
+        self.__qtable = qtable
+        self.__learning_rate = learning_rate
+        self.__discount_factor = discount_factor
+        self.__epsilon = epsilon if epsilon is not None else ExponentialEpsilon()
+        self.__rng = rng if rng is not None else random.Random()
+        self.__explore_ties_only = explore_ties_only
+        # Sum of the squared changes of the qtable values during the match
+        self.__q_delta = 0.0
+
+    def reset(self):
+        self.__epsilon.reset()
+        self.__q_delta = 0.0
+
+    def explore(self):
+        """
+        Return a random action with the probability of the exploration, None otherwise.
+        """
+        explored = None
+        if self.__rng.random() < self.__epsilon.value:
+            explored = self.__rng.randrange(len(self.__qtable.actions))
+        self.__epsilon.step(explored is not None)
+        return explored
+
+    # Values of every action the policy follows for an observation
+    def values(self, observation):
+        return self.__qtable.row(observation)
+
+    # Best action of an observation and its value, cached by the qtable
+    def greedy(self, observation):
+        qtable = self.__qtable
+        return int(qtable.argmax(observation)), qtable.max(observation)
+
+    def select_action(self, observation, explore=True):
+        """
+        Epsilon-greedy action of an observation: the explored action if explore() gives one, the
+        greedy one otherwise. With explore_ties_only, the explored action is only kept when it is as
+        good as the greedy one.
+        """
+        best = self.explore() if explore else None
+        if best is not None and not self.__explore_ties_only:
+            return best
+        greedy, value = self.greedy(observation)
+        if best is None or self.values(observation)[best] < value:
+            best = greedy
+        return best
+
+    # Called with the action the agent plays, whichever way it was selected
+    def selected(self, action):
+        pass
+
+    def update(self, observation, action, reward, next_observation):
+        raise NotImplementedError
+
+    def target(self, reward, next_value):
+        # the value of the next observation is never below 0
+        return reward + self.__discount_factor * max(0.0, float(next_value))
+
+    def learn(self, qtable, observation, action, target):
+        """
+        Move the value of the action of an observation towards target.
+        """
+        value = qtable.row(observation)[action]
+        delta = self.__learning_rate * (target - value)
+        qtable.update(observation, action, value + delta)
+        self.__q_delta += delta * delta
+
+    def learn_all(self, qtable, observations, actions, deltas):
+        """
+        Add deltas to the values of distinct (observation, action) pairs, in one NumPy operation.
+        """
+        qtable.add(observations, actions, deltas)
+        self.__q_delta += float(np.dot(deltas, deltas))
+
+    def learn_batch(self, qtable, observations, actions, targets, weights=None):
+        """
+        Move the values of a minibatch of pairs towards their targets, see QTable.update_batch.
+        Return the error of every sample.
+        """
+        errors = qtable.update_batch(observations, actions, targets, self.__learning_rate, weights)
+        self.__q_delta += float(np.dot(errors, errors)) * self.__learning_rate ** 2
+        return errors
+
+    def save(self, file_name):
+        for qtable, qtable_file_name in zip(self.qtables, self.file_names(file_name)):
+            qtable.save(qtable_file_name)
+
+    # Files written by save(file_name), one per qtable
+    def file_names(self, file_name):
+        return [file_name + QTABLE_EXTENSION]
+
+    def load(self, file_name, encoder=None):
+        """
+        Load the saved qtables, checking that they observe the same arena as encoder if given.
+        """
+        self.qtable = load_qtable(file_name + QTABLE_EXTENSION, encoder)
+
+    def _get_qtable(self):
+        return self.__qtable
+
+    def _set_qtable(self, qtable):
+        self.__qtable = qtable
+
+    qtable = property(_get_qtable, _set_qtable)
+
+    def _get_rng(self):
+        return self.__rng
+
+    def _set_rng(self, rng):
+        self.__rng = rng
+
+    rng = property(_get_rng, _set_rng)
+
+    @property
+    def explore_ties_only(self):
+        return self.__explore_ties_only
+
+    # NumPy generator of the learner, None if it only draws from rng
+    @property
+    def numpy_rng(self):
+        return None
+
+    # every qtable the learner saves
+    @property
+    def qtables(self):
+        return [self.__qtable]
+
+    @property
+    def epsilon(self):
+        return self.__epsilon
+
+    @property
+    def exploration(self):
+        return self.__epsilon.value
+
+    @property
+    def learning_rate(self):
+        return self.__learning_rate
+
+    @property
+    def discount_factor(self):
+        return self.__discount_factor
+
+    @property
+    def q_delta(self):
+        return self.__q_delta
+
+
+class QLearning(Learner):
+    """
+    Q(s, a) <- Q(s, a) + learning_rate * [reward + discount_factor * max(Q(s')) - Q(s, a)]
+    """
+
+    def update(self, observation, action, reward, next_observation):
+        qtable = self.qtable
+        self.learn(qtable, observation, action, self.target(reward, qtable.max(next_observation)))
+
+
+class Sarsa(Learner):
+    """
+    Q(s, a) <- Q(s, a) + learning_rate * [reward + discount_factor * Q(s', a') - Q(s, a)]
+    The next action a' is only known once the agent selects it, so the update waits for it.
+    """
+
+    def __init__(self, qtable, *args, **kwargs):
+        super().__init__(qtable, *args, **kwargs)
+        self.__pending = None
+
+    def __flush(self):
+        # a transition without next action bootstraps from the best one, as the last one of a match
+        if self.__pending is not None:
+            observation, action, reward, next_observation = self.__pending
+            self.__pending = None
+            self.learn(self.qtable, observation, action, self.target(reward, self.qtable.max(next_observation)))
+
+    def reset(self):
+        self.__flush()
+        super().reset()
+
+    def selected(self, action):
+        if self.__pending is not None:
+            observation, previous_action, reward, next_observation = self.__pending
+            self.__pending = None
+            self.learn(self.qtable, observation, previous_action,
+                       self.target(reward, self.qtable.row(next_observation)[action]))
+
+    def update(self, observation, action, reward, next_observation):
+        self.__flush()
+        self.__pending = (observation, action, reward, next_observation)
+
+
+class TraceBuffer:
+    """
+    Eligibility traces of the (observation, action) pairs visited during a match, in preallocated
+    arrays. Only the traces above minimum are kept, at most length of them: the oldest are dropped.
+    """
+
+    def __init__(self, length=TRACE_LENGTH, minimum=TRACE_MINIMUM):
+        self.__minimum = minimum
+        self.__observations = np.zeros(length, dtype=np.int64)
+        self.__actions = np.zeros(length, dtype=np.int64)
+        self.__traces = np.zeros(length, dtype=np.float64)
+        self.__count = 0
+
+    def clear(self):
+        self.__count = 0
+
+    def visit(self, observation, action):
+        """
+        Set the trace of a pair to 1 (replacing traces), it becomes the newest one.
+        """
+        count = self.__count
+        observations, actions, traces = self.__observations, self.__actions, self.__traces
+        found = np.flatnonzero((observations[:count] == observation) & (actions[:count] == action))
+        if len(found):
+            start = found[0]
+        elif count == len(traces):
+            start = 0
+        else:
+            self.__count += 1
+            start = count
+        # the pairs after start move one slot back to keep the traces sorted from the oldest
+        end = self.__count - 1
+        observations[start:end] = observations[start + 1:end + 1]
+        actions[start:end] = actions[start + 1:end + 1]
+        traces[start:end] = traces[start + 1:end + 1]
+        observations[end] = observation
+        actions[end] = action
+        traces[end] = 1.0
+
+    def decay(self, factor):
+        count = self.__count
+        traces = self.__traces[:count]
+        traces *= factor
+        # traces decay from the newest to the oldest, the oldest ones are the first to fall below minimum
+        dropped = int(np.searchsorted(traces, self.__minimum))
+        if dropped:
+            self.__observations[:count - dropped] = self.__observations[dropped:count]
+            self.__actions[:count - dropped] = self.__actions[dropped:count]
+            self.__traces[:count - dropped] = self.__traces[dropped:count]
+            self.__count -= dropped
+
+    @property
+    def observations(self):
+        return self.__observations[:self.__count]
+
+    @property
+    def actions(self):
+        return self.__actions[:self.__count]
+
+    @property
+    def traces(self):
+        return self.__traces[:self.__count]
+
+
+class QLambda(Learner):
+    """
+    Q-learning with eligibility traces: every update also moves the pairs visited earlier in the
+    match, each by its trace, decayed by discount_factor * trace_decay at every step. Kill and death
+    rewards reach the last moves in one update instead of one move per visit.
+    The traces are not cut by the explored actions (naive Q(lambda)): the exploration restarts at
+    1 every match, cutting them would keep them short. They are cleared at every match.
+    """
+
+    def __init__(self, qtable, *args, trace_decay=TRACE_DECAY, trace_length=TRACE_LENGTH, **kwargs):
+        super().__init__(qtable, *args, **kwargs)
+        self.__trace_decay = trace_decay
+        self.__traces = TraceBuffer(trace_length)
+
+    def reset(self):
+        self.__traces.clear()
+        super().reset()
+
+    def update(self, observation, action, reward, next_observation):
+        qtable = self.qtable
+        traces = self.__traces
+        delta = self.target(reward, qtable.max(next_observation)) - float(qtable.row(observation)[action])
+        traces.visit(observation, action)
+        self.learn_all(qtable, traces.observations, traces.actions, self.learning_rate * delta * traces.traces)
+        traces.decay(self.discount_factor * self.__trace_decay)
+
+    @property
+    def trace_decay(self):
+        return self.__trace_decay
+
+
+class ReplayQLearning(Learner):
+    """
+    Q-learning from an experience replay: every transition is stored in a ReplayBuffer and, every
+    replay_every transitions, a minibatch of batch_size transitions sampled from the buffer is
+    learned in one vectorized update. The last transition of a match does not bootstrap.
+    """
+
+    def __init__(self, qtable, *args, replay_size=REPLAY_SIZE, batch_size=REPLAY_BATCH, replay_every=REPLAY_EVERY,
+                 prioritized=False, **kwargs):
+        super().__init__(qtable, *args, **kwargs)
+        # the minibatches are drawn by a NumPy generator seeded from the generator of the agent
+        self.__buffer = ReplayBuffer(replay_size, np.random.default_rng(self.rng.getrandbits(64)), prioritized)
+        self.__batch_size = batch_size
+        self.__replay_every = replay_every
+        self.__transitions = 0
+
+    def reset(self):
+        self.__buffer.mark_done()
+        super().reset()
+
+    def update(self, observation, action, reward, next_observation):
+        buffer = self.__buffer
+        buffer.add(observation, action, reward, next_observation)
+        self.__transitions += 1
+        if self.__transitions % self.__replay_every == 0 and len(buffer) >= self.__batch_size:
+            self.replay()
+
+    def replay(self):
+        buffer = self.__buffer
+        qtable = self.qtable
+        indices, weights = buffer.sample(self.__batch_size)
+        # the value of the next observations is never below 0, as for a single update
+        next_values = np.maximum(0.0, qtable.max(buffer.next_observations[indices]))
+        targets = buffer.rewards[indices] + self.discount_factor * np.where(buffer.dones[indices], 0.0, next_values)
+        errors = self.learn_batch(qtable, buffer.observations[indices], buffer.actions[indices], targets, weights)
+        buffer.update_priorities(indices, errors)
+
+    @property
+    def numpy_rng(self):
+        return self.__buffer.rng
+
+    @property
+    def buffer(self):
+        return self.__buffer
+
+
+class DoubleQLearning(Learner):
+    """
+    Two qtables, each updated half of the time with the value the other gives to its own best
+    next action, which avoids the overestimation of max(Q(s')). The policy follows their sum.
+    The second qtable is saved next to the first one, with a _b suffix.
+    """
+
+    def __init__(self, qtable, *args, **kwargs):
+        super().__init__(qtable, *args, **kwargs)
+        self.__second = qtable.copy()
+
+    def values(self, observation):
+        return self.qtable.row(observation) + self.__second.row(observation)
+
+    def greedy(self, observation):
+        row = self.values(observation)
+        best = int(row.argmax())
+        return best, row[best]
+
+    def update(self, observation, action, reward, next_observation):
+        updated, other = self.qtable, self.__second
+        if self.rng.random() < 0.5:
+            updated, other = other, updated
+        best = int(updated.argmax(next_observation))
+        self.learn(updated, observation, action, self.target(reward, other.row(next_observation)[best]))
+
+    def file_names(self, file_name):
+        return [file_name + QTABLE_EXTENSION, f"{file_name}_b{QTABLE_EXTENSION}"]
+
+    def load(self, file_name, encoder=None):
+        super().load(file_name, encoder)
+        if os.path.isfile(f"{file_name}_b{QTABLE_EXTENSION}"):
+            self.__second = load_qtable(f"{file_name}_b{QTABLE_EXTENSION}", encoder)
+
+    # a new qtable (loaded, merged...) starts a new second qtable
+    def _set_qtable(self, qtable):
+        Learner._set_qtable(self, qtable)
+        self.__second = qtable.copy()
+
+    qtable = property(Learner._get_qtable, _set_qtable)
+
+    @property
+    def qtables(self):
+        return [self.qtable, self.__second]
+
+
+LEARNERS = {'qlearning': QLearning, 'sarsa': Sarsa, 'double': DoubleQLearning, 'qlambda': QLambda,
+            'replay': ReplayQLearning}
+
+
+def learner_factory(name=LEARNER, epsilon=None, **options):
+    """
+    Return a function building the learner of an agent from its qtable and its random generator.
+    epsilon builds the exploration schedule of every agent, options are the hyperparameters.
+    """
+    learner_class = LEARNERS[name]
+
+    def build(qtable, rng=None):
+        return learner_class(qtable, epsilon=epsilon() if epsilon is not None else None, rng=rng, **options)
+    return build
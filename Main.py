@@ -1,47 +1,42 @@
 # Game environment class
+import argparse
 import os
+import time
 
 import arcade
-import matplotlib.pyplot as plt
+from arcade.gl import geometry
 from arcade.gui import UIManager
 
-from AgentManager import AgentManager
+from Agent import Agent, load_sound
+from Metrics import Metrics, RingBufferSink, sink_for_file
+from PlotScores import plot_scores
+from QTable import QTable, header_encoder
+from Replay import EpisodePlayer, read_episodes
+from Trainer import Trainer
 from GameEnvironement import *
 
 
-AMBIANCE_SOUND = arcade.load_sound(f"{SOUNDS_PATH}/ambiance.mp3")
-
-
-def display_plot():
+def display_plot(file_name=SCORE_LOG_PATH):
     """
-    Display a plot of data
+    Display a plot of the score log
     """
-    # print(SCORE_TABLES_EVOLUTIONS)
-
-    X = PLT_GENERATION_NUMBER
+    if os.path.isfile(file_name):
+        plot_scores(file_name)
 
-    # Assign variables to the y axis part of the curve
-    y = SCORE_TABLES_EVOLUTIONS[0]
-    z = SCORE_TABLES_EVOLUTIONS[1]
 
-    # print(y)
-    # print(z)
-    # print(X)
-
-    # Plotting both the curves simultaneously
-    plt.plot(X, y, color='r', label='Agent 1')
-    plt.plot(X, z, color='g', label='Agent 2')
-
-    # Naming the x-axis, y-axis and the whole graph
-    plt.xlabel("Generations")
-    plt.ylabel("Scores")
-    plt.title("Evolution of the scores by agents")
+def saved_health_buckets(qtable_path=QTABLE_PATH):
+    """
+    Health buckets of the first qtable saved under qtable_path, the default if there is none.
+    """
+    file_name = f"{qtable_path}0{QTABLE_EXTENSION}"
+    if not os.path.isfile(file_name):
+        return HEALTH_BUCKETS
+    return header_encoder(QTable.read_header(file_name)[0]).health_buckets
 
-    # Adding legend, which helps us recognize the curve according to it's color
-    plt.legend()
 
-    # To load the display window
-    plt.show()
+def set_text(text, value):
+    if text.text != value:
+        text.text = value
 
 
 class MyGame(arcade.Window):
@@ -49,18 +44,44 @@ class MyGame(arcade.Window):
     Main application class.
     """
 
-    def __init__(self):
+    def __init__(self, replay=False, metrics_file=None, steps_per_frame=1, episode_file=None, episode_index=0,
+                 health_buckets=None):
 
         # Call the parent class and set up the window
         super().__init__(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
 
+        # The last generations metrics are kept in memory, and written to metrics_file if given
+        self.metrics = Metrics([RingBufferSink()])
+        if metrics_file:
+            self.metrics.add_sink(sink_for_file(metrics_file))
+        # An episode log is played back as recorded, without the learning
+        self.episodes = []
+        self.episode_index = episode_index
+        arena = ARENA
+        # without health_buckets, the agents observe the health as the saved qtables do
+        if health_buckets is None:
+            health_buckets = saved_health_buckets()
+        qtable_path = QTABLE_PATH
+        if episode_file:
+            header, self.episodes = read_episodes(episode_file)
+            arena = header['arena']
+            # logs recorded before the health buckets were saved used the default
+            health_buckets = header.get('health_buckets', HEALTH_BUCKETS)
+            # the episodes are played back without any qtable
+            qtable_path = None
+            replay = True
+        # In replay mode the agents only play their saved qtable
+        self.trainer = Trainer(arena, learning=not replay, max_iterations=None, qtable_path=qtable_path,
+                               health_buckets=health_buckets, metrics=self.metrics,
+                               score_log_path=None if replay else SCORE_LOG_PATH)
+        self.episode_player = None
+        if self.episodes:
+            self.episode_player = EpisodePlayer(self.episodes[self.episode_index], self.trainer.agent_manager.agents)
         # Our Scene Object
-        self.ia_env = GameEnvironment(ARENA)
+        self.ia_env = self.trainer.environment
         # initialize AgentManager
-        self.ia_am = AgentManager(self.ia_env, 2, MAX_HP)
+        self.ia_am = self.trainer.agent_manager
 
-        SCORE_TABLES_EVOLUTIONS[0] = []
-        SCORE_TABLES_EVOLUTIONS[1] = []
         self.scene = None
 
         # Initialize  Ui Manager
@@ -80,13 +101,21 @@ class MyGame(arcade.Window):
         # Our physics engine
         self.physics_engine = None
         self.wall_list = None
+        # Background, decor and tiles, and the texture they are rendered in
+        self.static_list = None
+        self.static_texture = None
         self.music_toggle_button = None
-        self.ambiance_player = arcade.play_sound(AMBIANCE_SOUND, 0.8, 0.0, True)
-        self.__generation_counter = 0
-        self.__iteration_counter = 0
+        # Learning steps run by each on_update
+        self.steps_per_frame = steps_per_frame
+        self.frame_counter = 0
+        # The window is only drawn, and its buffers flipped, when something drawn changed
+        self.needs_redraw = True
+        self.frame_drawn = False
+        self.last_view_state = None
+        self.ambiance_player = arcade.play_sound(load_sound("ambiance.mp3"), 0.8, 0.0, True)
 
     def setup(self):
-        """Set up the game here. Call this function to restart the game."""
+        """Set up the game here, once. reset_scene restarts the game."""
 
         # Initialize Scene
         self.scene = arcade.Scene()
@@ -94,17 +123,14 @@ class MyGame(arcade.Window):
 
         self.background = arcade.load_texture(f"{SPRITES_PATH}/BG.png")
 
-        # retrieve first agent of the ia_am
-        self.player_one_sprite = self.ia_am.agents[0]
-        self.player_one_sprite.center_x = self.player_one_sprite.state[1] * PLAYER_START_X
-        self.player_one_sprite.center_y = PLAYER_ONE_START_Y
+        # the sprites observe the agents of the ia_am
+        self.player_one_sprite = Agent(self.ia_am.agents[0], 'male', RIGHT_FACING)
         self.scene.add_sprite(LAYER_NAME_PLAYER_ONE, self.player_one_sprite)
 
-        # Set up the player two, specifically placing it at these coordinates.
-        self.player_two_sprite = self.ia_am.agents[1]
-        self.player_two_sprite.center_x = self.player_two_sprite.state[1] * PLAYER_START_X
-        self.player_two_sprite.center_y = PLAYER_TWO_START_Y
+        # Set up the player two
+        self.player_two_sprite = Agent(self.ia_am.agents[1], 'female', LEFT_FACING)
         self.scene.add_sprite(LAYER_NAME_PLAYER_TWO, self.player_two_sprite)
+        self.mute_fast_forward()
 
         self.wall_list = arcade.SpriteList(use_spatial_hash=True)
 
@@ -169,17 +195,20 @@ class MyGame(arcade.Window):
         self.player_two_block.position = [-100, -100]
         self.player_two_block.alpha = 160
 
+        # Hearts are created once and put back in the health bars on each new match
+        self.player_one_hearts = []
         for i in range(1, self.player_one_sprite.health + 1):
             coordinate_heart = [60 + i * 30, 600]
             heart = arcade.Sprite(f"{SPRITES_PATH}/objects/heart.png", 0.05)
             heart.position = coordinate_heart
-            self.player_one_sprite.health_bar.append(heart)
+            self.player_one_hearts.append(heart)
 
+        self.player_two_hearts = []
         for i in range(1, self.player_two_sprite.health + 1):
             coordinate_heart = [940 - i * 30, 600]
             heart = arcade.Sprite(f"{SPRITES_PATH}/objects/heart.png", 0.05)
             heart.position = coordinate_heart
-            self.player_two_sprite.health_bar.append(heart)
+            self.player_two_hearts.append(heart)
 
         self.music_toggle_button = arcade.gui.UITextureButton(
             x=930,
@@ -207,6 +236,56 @@ class MyGame(arcade.Window):
             self.player_two_sprite, gravity_constant=GRAVITY, walls=self.scene["Walls"]
         )
 
+        # The layers which never change are drawn with a single sprite list
+        background = arcade.Sprite(texture=self.background)
+        background.width = SCREEN_WIDTH
+        background.height = SCREEN_HEIGHT
+        background.position = [SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2]
+        self.static_list = arcade.SpriteList()
+        self.static_list.append(background)
+        self.static_list.extend(self.wall_list)
+        self.static_list.extend(self.scene["Walls"])
+        # rendered once in a texture, drawn as one quad every frame
+        self.static_quad = geometry.quad_2d_fs()
+        self.static_program = self.ctx.load_program(
+            vertex_shader=":resources:shaders/texture_default_projection_vs.glsl",
+            fragment_shader=":resources:shaders/texture_fs.glsl")
+        self.render_static_layers()
+
+        # Effects drawn over the players
+        self.effect_list = arcade.SpriteList()
+        self.effect_list.extend([self.player_one_prout, self.player_two_prout,
+                                 self.player_one_block, self.player_two_block, self.bone])
+
+        # Texts are laid out again only when their value changes
+        self.player_one_score_text = arcade.Text("", 30, 550, arcade.csscolor.WHITE, 14, bold=True)
+        self.player_two_score_text = arcade.Text("", 885, 550, arcade.csscolor.WHITE, 14, bold=True)
+        self.iteration_text = arcade.Text("", 30, 30, arcade.csscolor.WHITE, 14, bold=True)
+        self.speed_text = arcade.Text("", 885, 10, arcade.csscolor.WHITE, 14, bold=True)
+        self.generation_text = arcade.Text("", 30, 10, arcade.csscolor.WHITE, 14, bold=True)
+
+        self.reset_scene()
+
+    def reset_scene(self):
+        """Put the sprites back in place for a new match, without creating them again."""
+        self.player_one_sprite.reset_animation()
+        self.player_two_sprite.reset_animation()
+
+        self.player_one_sprite.center_x = self.player_one_sprite.state[1] * PLAYER_START_X
+        self.player_one_sprite.center_y = PLAYER_ONE_START_Y
+
+        # Set up the player two, specifically placing it at these coordinates.
+        self.player_two_sprite.center_x = self.player_two_sprite.state[1] * PLAYER_START_X
+        self.player_two_sprite.center_y = PLAYER_TWO_START_Y
+
+        for effect in [self.player_one_prout, self.player_two_prout, self.player_one_block, self.player_two_block]:
+            effect.position = [-100, -100]
+
+        self.player_one_sprite.health_bar.clear()
+        self.player_one_sprite.health_bar.extend(self.player_one_hearts)
+        self.player_two_sprite.health_bar.clear()
+        self.player_two_sprite.health_bar.extend(self.player_two_hearts)
+
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed."""
         # Gui
@@ -216,7 +295,7 @@ class MyGame(arcade.Window):
         # Player One Actions
         if key == arcade.key.R:
             self.ia_am.reset()
-            self.setup()
+            self.reset_scene()
 
         if key == arcade.key.I:
             self.load_qtable(self.ia_am.agents, "I")
@@ -230,6 +309,47 @@ class MyGame(arcade.Window):
         if key == arcade.key.P:
             self.ia_am.player_1_priority = not self.ia_am.player_1_priority
 
+        if key == arcade.key.F:
+            self.cycle_steps_per_frame()
+
+        self.needs_redraw = True
+
+    def on_resize(self, width, height):
+        super().on_resize(width, height)
+        if self.static_list is not None:
+            self.render_static_layers()
+        self.needs_redraw = True
+
+    def on_expose(self):
+        self.needs_redraw = True
+
+    def on_mouse_motion(self, x, y, dx, dy):
+        # the buttons of the ui change when hovered
+        self.needs_redraw = True
+
+    def render_static_layers(self):
+        """Draw the background, the decor and the tiles in a texture of the size of the window."""
+        self.static_texture = self.ctx.texture(self.get_framebuffer_size(), components=4)
+        framebuffer = self.ctx.framebuffer(color_attachments=[self.static_texture])
+        with framebuffer.activate():
+            framebuffer.clear()
+            self.static_list.draw()
+
+    def cycle_steps_per_frame(self):
+        if self.steps_per_frame in STEPS_PER_FRAME:
+            index = (STEPS_PER_FRAME.index(self.steps_per_frame) + 1) % len(STEPS_PER_FRAME)
+        else:
+            index = 0
+        self.steps_per_frame = STEPS_PER_FRAME[index]
+        self.sync_sprites()
+        self.mute_fast_forward()
+        self.needs_redraw = True
+
+    def mute_fast_forward(self):
+        # the steps run faster than the animations play no sound, a sound per event would be hundreds per frame
+        for player_sprite in (self.player_one_sprite, self.player_two_sprite):
+            player_sprite.muted = self.steps_per_frame != 1
+
     def toggle_music(self, event):
         if self.active_ambiance:
             arcade.Sound.set_volume(self=self, volume=0, player=self.ambiance_player)
@@ -241,95 +361,67 @@ class MyGame(arcade.Window):
             self.music_toggle_button.texture = arcade.load_texture(
                 ':resources:onscreen_controls/shaded_dark/music_on.png')
             self.active_ambiance = True
+        self.needs_redraw = True
 
     def on_draw(self):
-        """Render the screen."""
+        """Render the screen, only when something drawn changed (see flip)."""
+        if not self.needs_redraw:
+            return
+        self.needs_redraw = False
+        self.frame_drawn = True
+        start = time.perf_counter()
         # Clear the screen to the background color
         arcade.start_render()
-        # Draw the background texture
-        arcade.draw_lrwh_rectangle_textured(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, self.background)
-        # Draw all stripes
-        self.wall_list.draw()
+        # Draw the background, the decor and the tiles, rendered once by render_static_layers
+        self.static_texture.use(0)
+        self.static_quad.render(self.static_program)
         self.player_one_sprite.health_bar.draw()
         self.player_two_sprite.health_bar.draw()
 
-        # Draw our Scene
-        self.scene.draw()
-        self.player_one_prout.draw()
-        self.player_two_prout.draw()
-        self.player_one_block.draw()
-        self.player_two_block.draw()
-        self.bone.draw()
+        # Draw the players, then the effects
+        self.scene.draw([LAYER_NAME_PLAYER_ONE, LAYER_NAME_PLAYER_TWO])
+        self.effect_list.draw()
         self.ui_manager.draw()
 
         self.draw_text()
+        self.metrics.add_time('render', time.perf_counter() - start)
 
     def draw_text(self):
         # Draw player scores
-        player_one_score = f"Score: {self.player_one_sprite.score}"
-        arcade.draw_text(
-            player_one_score,
-            30,
-            550,
-            arcade.csscolor.WHITE,
-            14,
-            bold=True
-        )
-
-        # Draw player scores
-        player_two_score = f"Score: {self.player_two_sprite.score}"
-        arcade.draw_text(
-            player_two_score,
-            885,
-            550,
-            arcade.csscolor.WHITE,
-            14,
-            bold=True
-        )
+        set_text(self.player_one_score_text, f"Score: {self.player_one_sprite.score}")
+        self.player_one_score_text.draw()
+        set_text(self.player_two_score_text, f"Score: {self.player_two_sprite.score}")
+        self.player_two_score_text.draw()
 
         # Draw game iterations
-        game_iterations = f"Iteration: {self.__iteration_counter}"
-        arcade.draw_text(
-            game_iterations,
-            30,
-            30,
-            arcade.csscolor.WHITE,
-            14,
-            bold=True
-        )
+        set_text(self.iteration_text, f"Iteration: {self.iteration_counter}")
+        self.iteration_text.draw()
 
-        # Draw game iterations
-        game_generation = f"Generation: {self.__generation_counter}"
-        arcade.draw_text(
-            game_generation,
-            30,
-            10,
-            arcade.csscolor.WHITE,
-            14,
-            bold=True
-        )
+        # Draw learning steps per frame
+        set_text(self.speed_text, f"Speed: x{self.steps_per_frame}" if self.steps_per_frame else "Speed: max")
+        self.speed_text.draw()
+
+        # Draw game generations
+        set_text(self.generation_text, f"Generation: {self.generation_counter}")
+        self.generation_text.draw()
 
     def on_update(self, delta_time):
         """Movement and game logic"""
-        # Remove heart
-        self.player_one_sprite = self.ia_am.agents[0]
-        self.player_two_sprite = self.ia_am.agents[1]
+        if self.steps_per_frame != 1:
+            self.fast_forward()
+            return
 
         if self.player_one_sprite.is_attacking:
             self.player_one_prout.position = self.player_one_sprite.position
-            self.player_one_prout.draw()
 
         if self.player_two_sprite.is_attacking:
             self.player_two_prout.position = self.player_two_sprite.position
-            self.player_two_prout.draw()
 
         if self.player_one_sprite.is_blocking:
             self.player_one_block.position = self.player_one_sprite.position
-            self.player_one_block.draw()
 
         if self.player_two_sprite.is_blocking:
             self.player_two_block.position = self.player_two_sprite.position
-            self.player_two_block.draw()
 
         self.update_health_bar(self.player_one_sprite)
         self.update_health_bar(self.player_two_sprite)
@@ -350,29 +442,102 @@ class MyGame(arcade.Window):
             delta_time, [LAYER_NAME_PLAYER_ONE, LAYER_NAME_PLAYER_TWO]
         )
 
-        if not self.ia_am.goal:
-            self.ia_am.best_actions()
-            self.ia_am.apply_actions(self.ia_am.get_alive_agents)
+        if not self.is_match_over:
+            self.advance()
             self.update_action_animation(True, self.player_one_sprite)
             self.update_action_animation(True, self.player_two_sprite)
-            self.__iteration_counter += 1
             self.update_action_animation(False, self.player_one_sprite)
             self.update_action_animation(False, self.player_two_sprite)
         else:
-            PLT_GENERATION_NUMBER.append(self.__generation_counter)
-            for i in range(len(self.ia_am.agents)):
-                SCORE_TABLES_EVOLUTIONS[i].append(self.ia_am.agents[i].score)
-            self.ia_am.reset()
-            self.setup()
-            self.__generation_counter += 1
-            if self.__generation_counter % 2 == 0:
-                self.save_qtables(self.ia_am.agents)
-            self.__iteration_counter = 0
+            self.next_match()
+            self.reset_scene()
 
         self.scene.update_animation(
             delta_time, [LAYER_NAME_PLAYER_ONE, LAYER_NAME_PLAYER_TWO]
         )
 
+        view_state = self.view_state()
+        if view_state != self.last_view_state:
+            self.last_view_state = view_state
+            self.needs_redraw = True
+
+    def view_state(self):
+        """Everything drawn which can change, the window is only redrawn when it does."""
+        sprites = [self.player_one_sprite, self.player_two_sprite] + list(self.effect_list)
+        return ([(sprite.center_x, sprite.center_y, sprite.texture) for sprite in sprites],
+                len(self.player_one_sprite.health_bar), len(self.player_two_sprite.health_bar),
+                self.player_one_sprite.score, self.player_two_sprite.score,
+                self.iteration_counter, self.generation_counter, self.steps_per_frame,
+                self.music_toggle_button.texture)
+
+    def flip(self):
+        # without a new frame, the buffers are not swapped and the window keeps showing the last one
+        if self.frame_drawn:
+            self.frame_drawn = False
+            super().flip()
+        else:
+            self.ctx.gc()
+
+    def fast_forward(self):
+        """Run steps_per_frame learning steps, or steps until FRAME_TIME_BUDGET if 0, without animations."""
+        deadline = time.perf_counter() + FRAME_TIME_BUDGET
+        steps = 0
+        new_match = False
+        while (steps < self.steps_per_frame if self.steps_per_frame else time.perf_counter() < deadline):
+            if not self.is_match_over:
+                self.advance()
+            else:
+                self.next_match()
+                new_match = True
+            steps += 1
+        if new_match:
+            self.reset_scene()
+        self.frame_counter += 1
+        if self.frame_counter % RENDER_EVERY == 0:
+            self.sync_sprites()
+            self.needs_redraw = True
+
+    def advance(self):
+        """Play one step, the next step of the episode when playing an episode log back."""
+        if self.episode_player is not None:
+            self.episode_player.step()
+        else:
+            self.trainer.step()
+
+    @property
+    def is_match_over(self):
+        if self.episode_player is not None:
+            return self.episode_player.is_over
+        return self.trainer.is_generation_over
+
+    def next_match(self):
+        if self.episode_player is not None:
+            self.episode_index = (self.episode_index + 1) % len(self.episodes)
+            self.episode_player = EpisodePlayer(self.episodes[self.episode_index], self.ia_am.agents)
+        else:
+            self.trainer.end_generation()
+
+    @property
+    def iteration_counter(self):
+        if self.episode_player is not None:
+            return self.episode_player.iteration
+        return self.trainer.iteration_counter
+
+    @property
+    def generation_counter(self):
+        if self.episode_player is not None:
+            return self.episode_player.episode.generation
+        return self.trainer.generation_counter
+
+    def sync_sprites(self):
+        """Put the sprites and the health bars at the state of the agents, after steps without animations."""
+        for player_sprite, hearts in [(self.player_one_sprite, self.player_one_hearts),
+                                      (self.player_two_sprite, self.player_two_hearts)]:
+            player_sprite.center_x = player_sprite.state[1] * PLAYER_START_X
+            player_sprite.is_touched = False
+            player_sprite.health_bar.clear()
+            player_sprite.health_bar.extend(hearts[:max(0, player_sprite.health)])
+
     def save_qtables(self, agents):
         for i in range(len(agents)):
             agents[i].save_qtable(f"../qtable_agent_{i}")
@@ -396,7 +561,6 @@ class MyGame(arcade.Window):
             if len(player_sprite.health_bar) > 0:
                 player_sprite.is_touched = False
                 player_sprite.health_bar.pop()
-                player_sprite.health_bar.draw()
 
     def update_action_animation(self, is_beginning, player_sprite):
         if is_beginning:
@@ -426,9 +590,23 @@ class MyGame(arcade.Window):
 
 def main():
     """Main function"""
-    window = MyGame()
+    parser = argparse.ArgumentParser(description="Watch the agents fight.")
+    parser.add_argument("--replay", action="store_true",
+                        help="replay the saved qtables without training the agents")
+    parser.add_argument("--metrics", help="write the metrics of every generation to this .jsonl or .csv file")
+    parser.add_argument("--steps-per-frame", type=int, default=1,
+                        help="learning steps per frame (0 for as many as the frame time allows), F to change it")
+    parser.add_argument("--episode", help="play the matches of an episode log back instead of running the agents")
+    parser.add_argument("--episode-index", type=int, default=0, help="match of the episode log to start with")
+    parser.add_argument("--health-buckets", type=int,
+                        help="health levels of each player the agents observe (default: those of the saved qtables)")
+    args = parser.parse_args()
+
+    window = MyGame(args.replay, args.metrics, args.steps_per_frame, args.episode, args.episode_index,
+                    args.health_buckets)
     window.setup()
     arcade.run()
+    window.trainer.close()
 
 
 if __name__ == "__main__":
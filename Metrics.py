@@ -0,0 +1,148 @@
+# Training metrics: phase timers, counters and per-generation aggregates
+import csv
+import json
+import math
+import os
+import time
+from collections import deque
+
+# Phases timed during the training, their times are exclusive of each other
+PHASES = ['select', 'apply', 'update', 'render', 'checkpoint']
+
+
+class Metrics:
+    """
+    Accumulate the time spent in every phase and the counters of a generation, then write
+    one flat record per generation to the sinks.
+    Timing is opt-in: the trainer and the environment only measure phases when they have a Metrics.
+    """
+
+    def __init__(self, sinks=()):
+        self.__sinks = list(sinks)
+        self.__times = dict.fromkeys(PHASES, 0.0)
+        self.__counters = {}
+        self.__agents = []
+        self.__start = time.perf_counter()
+
+    def add_time(self, phase, seconds):
+        self.__times[phase] += seconds
+
+    def time(self, phase):
+        return self.__times[phase]
+
+    def count(self, name, value=1):
+        self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def record_agents(self, agents):
+        """
+        Keep the score, the exploration and the qtable change of the agents, before they are reset.
+        """
+        self.__agents = [(agent.score, agent.exploration, math.sqrt(agent.q_delta)) for agent in agents]
+
+    def end_generation(self, generation, steps):
+        """
+        Write the record of the generation to the sinks and start the next one.
+        """
+        duration = time.perf_counter() - self.__start
+        record = {
+            'generation': generation,
+            'steps': steps,
+            'duration_s': duration,
+            'steps_per_s': steps / duration if duration > 0 else 0.0,
+        }
+        for phase in PHASES:
+            record[f'{phase}_s'] = self.__times[phase]
+        record.update(self.__counters)
+        for i, (score, exploration, q_delta_norm) in enumerate(self.__agents):
+            record[f'score_{i}'] = score
+            record[f'exploration_{i}'] = exploration
+            record[f'q_delta_norm_{i}'] = q_delta_norm
+        for sink in self.__sinks:
+            sink.write(record)
+
+        self.__times = dict.fromkeys(PHASES, 0.0)
+        self.__counters = {}
+        self.__agents = []
+        self.__start = time.perf_counter()
+        return record
+
+    def add_sink(self, sink):
+        self.__sinks.append(sink)
+
+    def close(self):
+        for sink in self.__sinks:
+            sink.close()
+
+    @property
+    def sinks(self):
+        return self.__sinks
+
+
+class JsonlSink:
+    """
+    Append every record as one JSON line.
+    """
+
+    def __init__(self, file_name):
+        self.__file = open(file_name, 'a')
+
+    def write(self, record):
+        self.__file.write(json.dumps(record) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class CsvSink:
+    """
+    Append every record as a CSV row, the columns are the keys of the first record.
+    """
+
+    def __init__(self, file_name):
+        self.__has_header = os.path.isfile(file_name) and os.path.getsize(file_name) > 0
+        self.__file = open(file_name, 'a', newline='')
+        self.__writer = None
+
+    def write(self, record):
+        if self.__writer is None:
+            self.__writer = csv.DictWriter(self.__file, fieldnames=list(record), extrasaction='ignore')
+            if not self.__has_header:
+                self.__writer.writeheader()
+        self.__writer.writerow(record)
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class RingBufferSink:
+    """
+    Keep the last size records in memory.
+    """
+
+    def __init__(self, size=1000):
+        self.__records = deque(maxlen=size)
+
+    def write(self, record):
+        self.__records.append(record)
+
+    def close(self):
+        pass
+
+    @property
+    def records(self):
+        return list(self.__records)
+
+    @property
+    def last(self):
+        return self.__records[-1] if self.__records else None
+
+
+def sink_for_file(file_name):
+    """
+    CsvSink for the .csv files, JsonlSink otherwise.
+    """
+    if file_name.endswith('.csv'):
+        return CsvSink(file_name)
+    return JsonlSink(file_name)
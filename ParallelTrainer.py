@@ -0,0 +1,183 @@
+# Multi-process self-play training
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from QTable import QTable
+from Trainer import Trainer
+from Environment import *
+
+
+def train_worker(task):
+    """
+    Train a headless Trainer from the broadcast qtables values.
+    Return the values and the visits of the qtables and the mean scores of the agents.
+    """
+    seed, generations, arena, max_iterations, values = task
+    # the agents only train the broadcast values, no saved qtable is loaded
+    trainer = Trainer(arena, max_iterations=max_iterations, save_every=0, qtable_path=None, sparse=False, seed=seed)
+    qtables = []
+    for qtable, agent_values in zip(trainer.qtables, values):
+        qtable = QTable(qtable.encoder, agent_values.copy())
+        qtable.track_visits()
+        qtables.append(qtable)
+    trainer.qtables = qtables
+    trainer.train(generations)
+
+    return [(qtable.values, qtable.visits) for qtable in trainer.qtables], trainer.score_log.mean_scores
+
+
+def train_shared_worker(task):
+    """
+    Train a headless Trainer directly on the shared qtables, Hogwild-style.
+    Return the mean scores of the agents.
+    """
+    seed, generations, arena, max_iterations, names = task
+    trainer = Trainer(arena, max_iterations=max_iterations, save_every=0, qtable_path=None, sparse=False, seed=seed)
+    qtables = [QTable.attach_shared(name, qtable.encoder)
+               for qtable, name in zip(trainer.qtables, names)]
+    trainer.qtables = qtables
+    trainer.train(generations)
+    for qtable in qtables:
+        qtable.close()
+
+    return trainer.score_log.mean_scores
+
+
+def merge_qtables(values, results, merge='visits'):
+    """
+    Merge the values trained by every worker for one agent.
+    With 'visits', every value is weighted by the number of times the worker updated it,
+    the values nobody updated are kept. With 'mean', the values are averaged.
+    """
+    if merge == 'mean':
+        merged = np.mean([worker_values for worker_values, _ in results], axis=0, dtype=np.float64)
+        return merged.astype(values.dtype)
+    weighted = np.zeros(values.shape, dtype=np.float64)
+    total = np.zeros(values.shape, dtype=np.float64)
+    for worker_values, visits in results:
+        weighted += worker_values * visits
+        total += visits
+    merged = values.copy()
+    np.divide(weighted, total, out=weighted, where=total > 0)
+    merged[total > 0] = weighted[total > 0]
+    return merged
+
+
+class ParallelTrainer:
+    """
+    Train in a pool of processes. Every round, each worker trains its own headless
+    GameEnvironment and AgentManager with its own seed, then the qtables of the workers
+    are merged and broadcast back for the next round.
+    With shared, the workers all update the same qtables in shared memory and nothing is merged.
+    """
+
+    def __init__(self, workers, generations_per_round, arena=ARENA, max_iterations=MAX_ITERATIONS,
+                 seed=0, merge='visits', qtable_path=QTABLE_PATH, shared=False):
+        self.__workers = workers
+        self.__generations_per_round = generations_per_round
+        self.__arena = arena
+        self.__max_iterations = max_iterations
+        self.__seed = seed
+        self.__merge = merge
+        # The coordinator trainer only holds the merged qtables
+        self.__trainer = Trainer(arena, max_iterations=max_iterations, save_every=0, qtable_path=qtable_path,
+                                 sparse=False)
+        self.__round_counter = 0
+        self.__scores = []
+        self.__shared = shared
+        if shared:
+            self.__trainer.qtables = [QTable.create_shared(qtable.encoder, qtable.values)
+                                      for qtable in self.__trainer.qtables]
+
+    def train_round(self, pool):
+        if self.__shared:
+            names = [qtable.shared_name for qtable in self.__trainer.qtables]
+            tasks = [(self.__seed + self.__round_counter * self.__workers + worker, self.__generations_per_round,
+                      self.__arena, self.__max_iterations, names) for worker in range(self.__workers)]
+            self.__scores = np.mean(pool.map(train_shared_worker, tasks), axis=0).tolist()
+            self.__round_counter += 1
+            return
+
+        values = [qtable.values for qtable in self.__trainer.qtables]
+        tasks = []
+        for worker in range(self.__workers):
+            seed = self.__seed + self.__round_counter * self.__workers + worker
+            tasks.append((seed, self.__generations_per_round, self.__arena, self.__max_iterations, values))
+        results = pool.map(train_worker, tasks)
+
+        for i, qtable in enumerate(self.__trainer.qtables):
+            qtable.values[...] = merge_qtables(qtable.values, [result[0][i] for result in results], self.__merge)
+            qtable.refresh_greedy()
+        self.__scores = np.mean([result[1] for result in results], axis=0).tolist()
+        self.__round_counter += 1
+
+    def train(self, rounds, save_every=1, verbose=False):
+        """
+        Train rounds rounds in a new pool, saving the qtables every save_every rounds and at the end.
+        """
+        with multiprocessing.Pool(self.__workers) as pool:
+            for _ in range(rounds):
+                self.train_round(pool)
+                if save_every and self.__round_counter % save_every == 0:
+                    self.save_qtables()
+                if verbose:
+                    print(f"{self.generations} generations, mean scores {self.scores}")
+        if not save_every or self.__round_counter % save_every != 0:
+            self.save_qtables()
+
+    def save_qtables(self):
+        self.__trainer.save_qtables()
+
+    # Free the shared memory of the qtables once the training is over
+    def close(self):
+        for qtable in self.__trainer.qtables:
+            qtable.unlink()
+
+    @property
+    def generations(self):
+        return self.__round_counter * self.__workers * self.__generations_per_round
+
+    @property
+    def scores(self):
+        return self.__scores
+
+    @property
+    def qtables(self):
+        return self.__trainer.qtables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the agents in a pool of processes.")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of training processes")
+    parser.add_argument("-r", "--rounds", type=int, default=10, help="number of merge rounds")
+    parser.add_argument("-g", "--generations", type=int, default=100,
+                        help="generations trained by every worker between two merges")
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS,
+                        help="iterations after which a generation is stopped (0 for no limit)")
+    parser.add_argument("--merge", choices=['visits', 'mean'], default='visits',
+                        help="how the qtables of the workers are combined")
+    parser.add_argument("--shared", action="store_true",
+                        help="train all the workers on the same qtables in shared memory instead of merging")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first worker")
+    parser.add_argument("--qtable-path", default=QTABLE_PATH, help="prefix of the saved qtable files")
+    args = parser.parse_args()
+
+    trainer = ParallelTrainer(args.workers, args.generations, max_iterations=args.max_iterations or None,
+                              seed=args.seed, merge=args.merge, qtable_path=args.qtable_path, shared=args.shared)
+    start = time.perf_counter()
+    try:
+        trainer.train(args.rounds, verbose=True)
+    finally:
+        # the shared memory blocks are unlinked even if the training is interrupted
+        trainer.close()
+    elapsed = time.perf_counter() - start
+    print(f"{trainer.generations} generations in {elapsed:.2f}s "
+          f"({trainer.generations / elapsed:.1f} generations/s)")
+
+
+if __name__ == "__main__":
+    main()
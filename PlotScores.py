@@ -0,0 +1,66 @@
+# Plot of the score log, offline or while the training runs
+import argparse
+
+from Environment import SCORE_LOG_PATH, SCORE_HISTORY_SIZE
+from ScoreLog import ScoreHistory, read_scores
+
+COLORS = ['r', 'g', 'b', 'm']
+
+
+def load_history(file_name, history=None, offset=0):
+    """
+    Add the generations logged after offset to the history, return the history and the new offset.
+    """
+    if history is None:
+        history = ScoreHistory(SCORE_HISTORY_SIZE)
+    generations, scores, offset = read_scores(file_name, offset)
+    for generation, generation_scores in zip(generations, scores):
+        history.append(generation, generation_scores)
+    return history, offset
+
+
+def draw(plt, history):
+    plt.clf()
+    for i, scores in enumerate(history.scores):
+        plt.plot(history.generations, scores, color=COLORS[i % len(COLORS)], label=f'Agent {i + 1}')
+
+    # Naming the x-axis, y-axis and the whole graph
+    plt.xlabel("Generations")
+    plt.ylabel("Scores")
+    plt.title("Evolution of the scores by agents")
+    if history.scores:
+        plt.legend()
+
+
+def plot_scores(file_name=SCORE_LOG_PATH, follow=False, interval=2.0):
+    """
+    Plot the scores of a score log. With follow, the plot is updated with the new generations
+    every interval seconds, only the end of the file being read each time.
+    """
+    # matplotlib is only imported once the plot is needed
+    import matplotlib.pyplot as plt
+
+    history, offset = load_history(file_name)
+    draw(plt, history)
+    if not follow:
+        plt.show()
+        return
+    while plt.get_fignums():
+        plt.pause(interval)
+        history, new_offset = load_history(file_name, history, offset)
+        if new_offset != offset:
+            offset = new_offset
+            draw(plt, history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot the scores logged by the training.")
+    parser.add_argument("score_log", nargs='?', default=SCORE_LOG_PATH, help="score log to plot")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep updating the plot while the log grows")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between two updates with --follow")
+    args = parser.parse_args()
+    plot_scores(args.score_log, args.follow, args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+import json
+import os
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Environment import ACTIONS, MAX_HP, DENSE_QTABLE_MAX_BYTES
+from StateEncoder import StateEncoder
+
+
+# Binary qtable file: magic, format version, header size, JSON header, then the raw values
+QTABLE_MAGIC = b'QTBL'
+QTABLE_VERSION = 2
+QTABLE_PREFIX = struct.Struct('<4sHI')
+# The values start on an aligned offset so that they can be memory-mapped
+QTABLE_ALIGNMENT = 64
+
+
+def write_qtable_file(file_name, header, arrays):
+    """
+    Write a binary qtable file with the header and the raw arrays following each other.
+    The file is replaced, never rewritten, as it may be memory-mapped by a loaded qtable.
+    """
+    header = json.dumps(header).encode('utf-8')
+    offset = QTABLE_PREFIX.size + len(header)
+    header += b' ' * (-offset % QTABLE_ALIGNMENT)
+    temp_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file_name, 'wb') as f:
+        f.write(QTABLE_PREFIX.pack(QTABLE_MAGIC, QTABLE_VERSION, len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temp_file_name, file_name)
+
+
+def update_batch(qtable, observations, actions, targets, learning_rate, weights=None):
+    """
+    Move the values of a minibatch of (observation, action) pairs towards their targets in one NumPy
+    operation. A pair sampled several times moves once, by the mean of its errors, each weighted by
+    weights if given. Return the error of every sample before the update.
+    """
+    n_actions = len(qtable.actions)
+    pairs, inverse, counts = np.unique(observations * n_actions + actions, return_inverse=True, return_counts=True)
+    errors = targets - qtable.row(observations)[np.arange(len(observations)), actions]
+    weighted = errors if weights is None else errors * weights
+    deltas = learning_rate * np.bincount(inverse, weighted, len(pairs)) / counts
+    qtable.add(pairs // n_actions, pairs % n_actions, deltas)
+    return errors
+
+
+def qtable_header(encoder, dtype, kind):
+    states = encoder.cells
+    return {
+        'version': QTABLE_VERSION,
+        'kind': kind,
+        'arena_shape': [max(s[0] for s in states) + 1, max(s[1] for s in states) + 1],
+        'states': [list(s) for s in states],
+        'actions': encoder.actions,
+        'health_buckets': encoder.health_buckets,
+        'max_health': encoder.max_health,
+        'dtype': np.dtype(dtype).str,
+    }
+
+
+# Version 1 files have no health buckets
+def header_encoder(header):
+    return StateEncoder([tuple(s) for s in header['states']], header['actions'],
+                        header.get('health_buckets', 1), header.get('max_health', MAX_HP))
+
+
+class QTable:
+    """
+    Dense qtable backed by a contiguous float32 array.
+    Values are indexed by [observation, action], the observation being encoded by a
+    StateEncoder, so that the values of all the actions for one observation are contiguous.
+    """
+
+    def __init__(self, encoder, values=None, visits=None):
+        self.__encoder = encoder
+
+        shape = (encoder.observations, len(encoder.actions))
+        if values is None:
+            values = np.zeros(shape, dtype=np.float32)
+        elif values.shape != shape:
+            raise ValueError(f"qtable values of shape {values.shape} do not match {shape}")
+        self.__values = values
+        # Number of updates of every value, only counted once track_visits is called
+        self.__visits = visits
+        # Values updated since the last pop_changes, only tracked once track_changes is called
+        self.__changed = None
+        # Shared memory block holding the values of a shared qtable
+        self.__shared_memory = None
+        # Best action and value of every observation, built by the first argmax or max (a loaded
+        # qtable is not read before) then kept up to date by the updates so that argmax and max do
+        # not scan the rows. Never built for the shared qtables, which other processes update
+        self.__best_actions = None
+        self.__best_values = None
+
+    @classmethod
+    def from_environment(cls, environment, sparse=None):
+        """
+        Build an empty qtable for the observations of the environment. It is a SparseQTable if sparse,
+        or if sparse is None and the dense values would take more than DENSE_QTABLE_MAX_BYTES.
+        """
+        encoder = environment.encoder
+        if sparse is None:
+            sparse = encoder.observations * len(encoder.actions) * 4 > DENSE_QTABLE_MAX_BYTES
+        if sparse:
+            return SparseQTable(encoder)
+        return cls(encoder)
+
+    @classmethod
+    def create_shared(cls, encoder, values=None, name=None):
+        """
+        Build a qtable whose values live in a multiprocessing shared memory block, so that
+        processes which attach_shared it read and update the same values without copies.
+
+        Consistency model (Hogwild): updates are not synchronized. Every float32 value is
+        read and written atomically, but two processes updating the same value at the same
+        time can lose one of the updates, and a process can read a row while another one is
+        updating it. Q-learning tolerates these races, as the updates of the processes
+        rarely hit the same values. Pickling a shared qtable (save_qtable) copies its values.
+        """
+        table = cls(encoder)
+        shared = shared_memory.SharedMemory(name=name, create=True, size=table.nbytes)
+        shared_values = np.ndarray(table.values.shape, dtype=table.values.dtype, buffer=shared.buf)
+        shared_values[...] = 0.0 if values is None else values
+        table.__values = shared_values
+        table.__shared_memory = shared
+        return table
+
+    @classmethod
+    def attach_shared(cls, name, encoder):
+        try:
+            # only the process which created the block unlinks it
+            shared = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before python 3.13, multiprocessing workers share the resource tracker of their parent
+            shared = shared_memory.SharedMemory(name=name)
+        table = cls(encoder)
+        table.__values = np.ndarray(table.values.shape, dtype=table.values.dtype, buffer=shared.buf)
+        table.__shared_memory = shared
+        return table
+
+    def close(self):
+        if self.__shared_memory is not None:
+            self.__values = np.array(self.__values)
+            self.__shared_memory.close()
+            self.__shared_memory = None
+
+    def unlink(self):
+        """
+        Free the shared memory block, the qtable keeps a private copy of its values.
+        """
+        if self.__shared_memory is not None:
+            shared = self.__shared_memory
+            self.close()
+            shared.unlink()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.__shared_memory is not None:
+            state['_QTable__values'] = np.array(self.__values)
+            state['_QTable__shared_memory'] = None
+        return state
+
+    @classmethod
+    def from_dict(cls, qtable):
+        """
+        Build a qtable from the nested dict qtable[s][a][s2][a2] used before.
+        """
+        states = list(qtable.keys())
+        actions = list(qtable[states[0]].keys()) if states else ACTIONS
+        table = cls(StateEncoder(states, actions, 1))
+        for s in states:
+            for a in actions:
+                for s2 in states:
+                    for a2 in actions:
+                        table.set(s, a, s2, a2, qtable[s][a][s2][a2])
+        return table
+
+    def save(self, file_name):
+        """
+        Write the qtable in the binary qtable format: a header describing the arena, the actions,
+        the observations and the array, followed by the raw values.
+        """
+        header = qtable_header(self.__encoder, self.__values.dtype, 'dense')
+        header['shape'] = list(self.__values.shape)
+        write_qtable_file(file_name, header, [self.__values])
+
+    @staticmethod
+    def read_header(file_name):
+        """
+        Return the header of a binary qtable file and the offset of its values.
+        """
+        with open(file_name, 'rb') as f:
+            magic, version, size = QTABLE_PREFIX.unpack(f.read(QTABLE_PREFIX.size))
+            if magic != QTABLE_MAGIC:
+                raise ValueError(f"{file_name} is not a qtable file")
+            if version > QTABLE_VERSION:
+                raise ValueError(f"{file_name} has the qtable format version {version}, "
+                                 f"only versions up to {QTABLE_VERSION} are supported")
+            header = json.loads(f.read(size).decode('utf-8'))
+        return header, QTABLE_PREFIX.size + size
+
+    @classmethod
+    def load(cls, file_name, mmap_mode='c'):
+        """
+        Open a binary qtable file. The values are memory-mapped, with the copy-on-write
+        mode 'c' by default so that the updates are not written back to the file.
+        mmap_mode=None reads the values in memory instead, as for the version 1 files.
+        """
+        header, offset = cls.read_header(file_name)
+        if header.get('kind', 'dense') == 'sparse':
+            return SparseQTable.load(file_name)
+        encoder = header_encoder(header)
+        dtype = np.dtype(header['dtype'])
+        shape = tuple(header['shape'])
+        if mmap_mode is None or header['version'] < 2:
+            with open(file_name, 'rb') as f:
+                f.seek(offset)
+                values = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+        else:
+            values = np.memmap(file_name, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+        if header['version'] < 2:
+            # version 1 values are [state, opponent state, opponent action, action],
+            # without the observations of an opponent which has not played yet
+            old_values = values
+            values = np.zeros((encoder.observations, len(encoder.actions)), dtype=dtype)
+            values.reshape(shape[0], shape[1], shape[2] + 1, shape[3])[:, :, :shape[2]] = old_values
+        return cls(encoder, values)
+
+    def to_dict(self):
+        states = self.__encoder.cells
+        actions = self.__encoder.actions
+        return {s: {a: {s2: {a2: float(self.get(s, a, s2, a2)) for a2 in actions}
+                        for s2 in states}
+                    for a in actions}
+                for s in states}
+
+    # Values of every action for one observation, or for an array of observations
+    def row(self, observation):
+        return self.__values[observation]
+
+    def max(self, observation):
+        if self.__best_values is None and not self.__build_greedy():
+            return self.__values[observation].max(axis=-1)
+        return self.__best_values[observation]
+
+    def argmax(self, observation):
+        if self.__best_actions is None and not self.__build_greedy():
+            return self.__values[observation].argmax(axis=-1)
+        return self.__best_actions[observation]
+
+    # Build the cache of the best actions and values, return False for the shared qtables which have none
+    def __build_greedy(self):
+        if self.__shared_memory is not None:
+            return False
+        self.__best_actions = self.__values.argmax(axis=-1).astype(np.min_scalar_type(self.__values.shape[1]))
+        self.__best_values = self.__values.max(axis=-1)
+        return True
+
+    def refresh_greedy(self, observations=None):
+        """
+        Recompute the cached best actions and values of observations. With None, the cache is
+        dropped and built again by the next argmax or max.
+        Needed after writing the values directly, not through update, add or set.
+        """
+        if self.__best_actions is None:
+            return
+        if observations is None:
+            self.__best_actions = self.__best_values = None
+            return
+        rows = self.__values[observations]
+        self.__best_actions[observations] = rows.argmax(axis=-1)
+        self.__best_values[observations] = rows.max(axis=-1)
+
+    def track_visits(self):
+        if self.__visits is None:
+            self.__visits = np.zeros(self.__values.shape, dtype=np.uint32)
+
+    def track_changes(self):
+        if self.__changed is None:
+            self.__changed = np.zeros(self.__values.shape, dtype=bool)
+
+    # Set a value updated by an agent
+    def update(self, observation, action, value):
+        values = self.__values
+        values[observation, action] = value
+        best_actions = self.__best_actions
+        if best_actions is not None:
+            # only the updated row can change, and it only needs a scan when its best value decreases
+            value = values[observation, action]
+            best = best_actions[observation]
+            if action == best:
+                if value >= self.__best_values[observation]:
+                    self.__best_values[observation] = value
+                else:
+                    best_actions[observation] = values[observation].argmax()
+                    self.__best_values[observation] = values[observation, best_actions[observation]]
+            elif value > self.__best_values[observation] or (value == self.__best_values[observation] and action < best):
+                best_actions[observation] = action
+                self.__best_values[observation] = value
+        if self.__visits is not None:
+            self.__visits[observation, action] += 1
+        if self.__changed is not None:
+            self.__changed[observation, action] = True
+
+    # Add deltas to the values of distinct (observation, action) pairs
+    def add(self, observations, actions, deltas):
+        self.__values[observations, actions] += deltas
+        if self.__best_actions is not None:
+            self.refresh_greedy(observations)
+        if self.__visits is not None:
+            self.__visits[observations, actions] += 1
+        if self.__changed is not None:
+            self.__changed[observations, actions] = True
+
+    def update_batch(self, observations, actions, targets, learning_rate, weights=None):
+        return update_batch(self, observations, actions, targets, learning_rate, weights)
+
+    def pop_changes(self):
+        """
+        Return the flat indices and a copy of the values updated since the last call.
+        """
+        indices = np.flatnonzero(self.__changed)
+        self.__changed.reshape(-1)[indices] = False
+        return indices, self.__values.reshape(-1)[indices]
+
+    def apply_changes(self, changes):
+        indices, values = changes
+        self.__values.reshape(-1)[indices] = values
+        if self.__best_actions is not None:
+            self.refresh_greedy(np.unique(indices // self.__values.shape[1]))
+
+    def copy(self):
+        return QTable(self.__encoder, np.array(self.__values))
+
+    # Access by state and action, as qtable[s][a][s2][a2]
+    def get(self, state, action, opponent_state, opponent_action):
+        encoder = self.__encoder
+        observation = encoder.encode(encoder.cell_index(state), encoder.cell_index(opponent_state),
+                                     encoder.action_index(opponent_action))
+        return self.__values[observation, encoder.action_index(action)]
+
+    def set(self, state, action, opponent_state, opponent_action, value):
+        encoder = self.__encoder
+        observation = encoder.encode(encoder.cell_index(state), encoder.cell_index(opponent_state),
+                                     encoder.action_index(opponent_action))
+        self.__values[observation, encoder.action_index(action)] = value
+        self.refresh_greedy(observation)
+
+    @property
+    def values(self):
+        return self.__values
+
+    @property
+    def shared_name(self):
+        if self.__shared_memory is None:
+            return None
+        return self.__shared_memory.name
+
+    @property
+    def visits(self):
+        return self.__visits
+
+    @property
+    def encoder(self):
+        return self.__encoder
+
+    @property
+    def states(self):
+        return self.__encoder.cells
+
+    @property
+    def actions(self):
+        return self.__encoder.actions
+
+    @property
+    def nbytes(self):
+        return self.__values.nbytes
+
+
+class SparseQTable:
+    """
+    Qtable which only stores the rows of values (one value per action) of the observations
+    written at least once. The other rows read as default. Used for the arenas whose dense
+    qtable would not fit in memory.
+    """
+
+    def __init__(self, encoder, default=0.0, dtype=np.float32):
+        self.__encoder = encoder
+        self.__default = default
+        self.__dtype = np.dtype(dtype)
+        self.__default_row = np.full(len(encoder.actions), default, dtype=self.__dtype)
+        self.__default_row.flags.writeable = False
+        self.__rows = {}
+        # Observations of the rows updated since the last pop_changes, only tracked once track_changes is called
+        self.__changed = None
+
+    def row(self, observation):
+        if np.ndim(observation) == 0:
+            return self.__rows.get(observation, self.__default_row)
+        return np.array([self.__rows.get(int(o), self.__default_row) for o in np.ravel(observation)])
+
+    def max(self, observation):
+        return self.row(observation).max(axis=-1)
+
+    def argmax(self, observation):
+        return self.row(observation).argmax(axis=-1)
+
+    # Set a value updated by an agent, the row is created on its first update
+    def update(self, observation, action, value):
+        row = self.__rows.get(observation)
+        if row is None:
+            row = self.__rows[observation] = self.__default_row.copy()
+        row[action] = value
+        if self.__changed is not None:
+            self.__changed.add(observation)
+
+    def add(self, observations, actions, deltas):
+        for observation, action, delta in zip(observations.tolist(), actions.tolist(), deltas.tolist()):
+            self.update(observation, action, self.row(observation)[action] + delta)
+
+    def update_batch(self, observations, actions, targets, learning_rate, weights=None):
+        return update_batch(self, observations, actions, targets, learning_rate, weights)
+
+    def track_changes(self):
+        if self.__changed is None:
+            self.__changed = set()
+
+    def pop_changes(self):
+        """
+        Return the observations and a copy of the rows updated since the last call.
+        """
+        changes = {observation: self.__rows[observation].copy() for observation in self.__changed}
+        self.__changed.clear()
+        return changes
+
+    def apply_changes(self, changes):
+        self.__rows.update(changes)
+
+    def copy(self):
+        table = SparseQTable(self.__encoder, self.__default, self.__dtype)
+        table.apply_changes({observation: row.copy() for observation, row in self.__rows.items()})
+        return table
+
+    def occupancy(self):
+        """
+        Number of rows stored, out of all the possible rows, and the memory they use.
+        """
+        total = self.__encoder.observations
+        return {
+            'rows': len(self.__rows),
+            'total_rows': total,
+            'ratio': len(self.__rows) / total if total else 0.0,
+            'nbytes': self.nbytes,
+            'dense_nbytes': total * len(self.__encoder.actions) * self.__dtype.itemsize,
+        }
+
+    def save(self, file_name):
+        """
+        Write the qtable in the binary qtable format: the header is followed by the int64
+        observations of the stored rows, then by the rows.
+        """
+        header = qtable_header(self.__encoder, self.__dtype, 'sparse')
+        header['default'] = self.__default
+        header['rows'] = len(self.__rows)
+        observations = np.array(list(self.__rows.keys()), dtype=np.int64)
+        rows = np.array(list(self.__rows.values()), dtype=self.__dtype).reshape(-1, len(self.__encoder.actions))
+        write_qtable_file(file_name, header, [observations, rows])
+
+    @classmethod
+    def load(cls, file_name):
+        header, offset = QTable.read_header(file_name)
+        encoder = header_encoder(header)
+        table = cls(encoder, header['default'], header['dtype'])
+        n_rows = header['rows']
+        with open(file_name, 'rb') as f:
+            f.seek(offset)
+            if header['version'] < 2:
+                # version 1 rows are keyed by int32 (state, opponent state, opponent action) triples
+                keys = np.fromfile(f, dtype=np.int32, count=n_rows * 3).reshape(-1, 3).astype(np.int64)
+                observations = encoder.encode(keys[:, 0], keys[:, 1], keys[:, 2])
+            else:
+                observations = np.fromfile(f, dtype=np.int64, count=n_rows)
+            rows = np.fromfile(f, dtype=header['dtype'], count=n_rows * len(encoder.actions))
+        rows = rows.reshape(n_rows, len(encoder.actions))
+        table.apply_changes({int(observation): row.copy() for observation, row in zip(observations, rows)})
+        return table
+
+    @property
+    def encoder(self):
+        return self.__encoder
+
+    @property
+    def states(self):
+        return self.__encoder.cells
+
+    @property
+    def actions(self):
+        return self.__encoder.actions
+
+    @property
+    def nbytes(self):
+        return sum(row.nbytes for row in self.__rows.values())
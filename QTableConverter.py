@@ -0,0 +1,35 @@
+# Convert the pickled qtables to the binary qtable format
+import argparse
+import os
+import pickle
+
+from QTable import QTable
+from Environment import *
+
+
+def convert(file_name, output_file_name=None):
+    """
+    Convert a pickled qtable, either a nested dict qtable[s][a][s2][a2] or a pickled QTable.
+    Only convert trusted files: unpickling can run arbitrary code.
+    """
+    with open(file_name, 'rb') as f:
+        qtable = pickle.load(f)
+    if isinstance(qtable, dict):
+        qtable = QTable.from_dict(qtable)
+    if output_file_name is None:
+        output_file_name = os.path.splitext(file_name)[0] + QTABLE_EXTENSION
+    qtable.save(output_file_name)
+    return output_file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled qtables (.dat) to the binary qtable format.")
+    parser.add_argument("files", nargs='+', help="pickled qtable files")
+    args = parser.parse_args()
+
+    for file_name in args.files:
+        print(f"{file_name} -> {convert(file_name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Recorded episodes, written by the training and played back by the game window
+import json
+import struct
+
+import numpy as np
+
+from AgentLogic import HIT_EVENT
+from Environment import ACTIONS, HEALTH_BUCKETS, PUNCH
+
+# Episode log: magic, format version, header size, JSON header, then the episodes one after the other
+EPISODE_MAGIC = b'EPLG'
+EPISODE_VERSION = 1
+EPISODE_PREFIX = struct.Struct('<4sHI')
+# Every episode starts with its generation, seed, number of steps and number of players
+EPISODE_HEADER = struct.Struct('<IqII')
+# State of one player at the start of the episode
+START_DTYPE = np.dtype([('cell', '<i2'), ('health', 'i1')])
+# Action of one player at one step, -1 if it did not play, and its state and reward after the step
+STEP_DTYPE = np.dtype([('cell', '<i2'), ('action', 'i1'), ('health', 'i1'), ('reward', '<i2')])
+
+
+class Episode:
+    """
+    One recorded match: the start of every player then steps[step, player] of STEP_DTYPE.
+    """
+
+    def __init__(self, generation, seed, start, steps):
+        self.__generation = generation
+        self.__seed = seed
+        self.__start = start
+        self.__steps = steps
+
+    @property
+    def generation(self):
+        return self.__generation
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    @property
+    def start(self):
+        return self.__start
+
+    @property
+    def steps(self):
+        return self.__steps
+
+    # total reward of every player
+    @property
+    def scores(self):
+        return self.__steps['reward'].sum(axis=0, dtype=np.int64).tolist()
+
+
+class EpisodeRecorder:
+    """
+    Append one episode every `every` generations to an episode log. Only the recorded
+    generations cost anything: one row of small integers per player and step, kept in a list
+    and written once the episode is over.
+    """
+
+    def __init__(self, file_name, arena, states, every=1, seed=None, health_buckets=HEALTH_BUCKETS):
+        self.__every = every
+        self.__seed = -1 if seed is None else seed
+        self.__recording = False
+        self.__generation = 0
+        self.__start = None
+        self.__rows = []
+        self.__scores = None
+        self.__action_indices = {action: i for i, action in enumerate(ACTIONS)}
+        self.__file = open(file_name, 'ab')
+        if self.__file.tell() == 0:
+            header = json.dumps({'arena': arena, 'states': [list(s) for s in states], 'actions': ACTIONS,
+                                 'health_buckets': health_buckets})
+            header = header.encode('utf-8')
+            self.__file.write(EPISODE_PREFIX.pack(EPISODE_MAGIC, EPISODE_VERSION, len(header)))
+            self.__file.write(header)
+
+    def begin(self, generation, agents):
+        """
+        Start recording the generation if it is one of every `every` generations.
+        """
+        self.__generation = generation
+        self.__recording = bool(self.__every) and generation % self.__every == 0
+        if self.__recording:
+            self.__start = np.array([(agent.cell, agent.health) for agent in agents], dtype=START_DTYPE)
+            self.__rows = []
+            self.__scores = [agent.score for agent in agents]
+
+    def record_step(self, actions, agents):
+        """
+        Record the actions the agents chose for the step, once the step is applied.
+        """
+        scores = [agent.score for agent in agents]
+        self.__rows.append([(agent.cell, -1 if action is None else self.__action_indices[action], agent.health,
+                             score - previous)
+                            for agent, action, score, previous in zip(agents, actions, scores, self.__scores)])
+        self.__scores = scores
+
+    def end(self):
+        if not self.__recording:
+            return
+        steps = np.array(self.__rows, dtype=STEP_DTYPE).reshape(-1, len(self.__start))
+        self.__file.write(EPISODE_HEADER.pack(self.__generation, self.__seed, len(steps), len(self.__start)))
+        self.__file.write(self.__start.tobytes())
+        self.__file.write(steps.tobytes())
+        self.__file.flush()
+        self.__recording = False
+        self.__rows = []
+
+    # the match being recorded is dropped, it is not over
+    def close(self):
+        self.__recording = False
+        self.__file.close()
+
+    @property
+    def recording(self):
+        return self.__recording
+
+
+def read_episodes(file_name):
+    """
+    Return the header of an episode log and its episodes.
+    """
+    with open(file_name, 'rb') as f:
+        magic, version, size = EPISODE_PREFIX.unpack(f.read(EPISODE_PREFIX.size))
+        if magic != EPISODE_MAGIC:
+            raise ValueError(f"{file_name} is not an episode log")
+        if version > EPISODE_VERSION:
+            raise ValueError(f"{file_name} has the episode format version {version}, "
+                             f"only versions up to {EPISODE_VERSION} are supported")
+        header = json.loads(f.read(size).decode('utf-8'))
+        episodes = []
+        while True:
+            data = f.read(EPISODE_HEADER.size)
+            if len(data) < EPISODE_HEADER.size:
+                break
+            generation, seed, n_steps, players = EPISODE_HEADER.unpack(data)
+            start = np.frombuffer(f.read(START_DTYPE.itemsize * players), dtype=START_DTYPE)
+            data = f.read(STEP_DTYPE.itemsize * n_steps * players)
+            if len(data) < STEP_DTYPE.itemsize * n_steps * players:
+                # episode cut by a run which stopped while writing it
+                break
+            steps = np.frombuffer(data, dtype=STEP_DTYPE).reshape(n_steps, players)
+            episodes.append(Episode(generation, seed, start, steps))
+    return header, episodes
+
+
+class EpisodePlayer:
+    """
+    Play a recorded episode on the agents of the game, without running their learning.
+    """
+
+    def __init__(self, episode, agents):
+        self.__episode = episode
+        self.__agents = agents
+        self.__step = 0
+        self.reset()
+
+    def reset(self):
+        self.__step = 0
+        for agent, start in zip(self.__agents, self.__episode.start):
+            agent.reset_for_new_match(agent.state)
+            agent.cell = int(start['cell'])
+            agent.health = int(start['health'])
+
+    def step(self):
+        """
+        Apply the next step of the episode to the agents, return False once the episode is over.
+        """
+        if self.is_over:
+            return False
+        row = self.__episode.steps[self.__step]
+        for agent, player in zip(self.__agents, row):
+            agent.is_touched = int(player['health']) < agent.health
+            action = ACTIONS[player['action']] if player['action'] >= 0 else None
+            agent.replay_step(int(player['cell']), action, int(player['health']), int(player['reward']))
+        for agent, opponent in zip(self.__agents, self.__agents[::-1]):
+            if agent.last_action == PUNCH and opponent.is_touched:
+                agent.notify(HIT_EVENT)
+        self.__step += 1
+        return True
+
+    @property
+    def is_over(self):
+        return self.__step >= len(self.__episode.steps)
+
+    @property
+    def iteration(self):
+        return self.__step
+
+    @property
+    def episode(self):
+        return self.__episode
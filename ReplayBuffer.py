@@ -0,0 +1,149 @@
+# Experience replay: transitions kept in a ring buffer and learned from by minibatches
+import numpy as np
+
+from Environment import PRIORITY_ALPHA, PRIORITY_BETA, REPLAY_SIZE
+
+
+class SumTree:
+    """
+    Sampling weights of size leaves, with the sums of their blocks of block_size leaves: a sum tree
+    of two levels, so that sampling in proportion to the weights only goes through the block sums
+    and one block per sample instead of all the weights. Leaves are written right away and the
+    sums of their blocks computed again by refresh, for all the leaves written since at once.
+    """
+
+    def __init__(self, size, block_size=None):
+        # blocks of about the square root of the size balance the two levels
+        self.__block_size = block_size or max(8, int(np.sqrt(size / 4)))
+        self.__blocks = np.zeros(-(-max(size, 1) // self.__block_size), dtype=np.float64)
+        self.__leaves = np.zeros(len(self.__blocks) * self.__block_size, dtype=np.float64)
+        # leaves written since the last refresh
+        self.__stale = []
+
+    def __getitem__(self, indices):
+        return self.__leaves[indices]
+
+    def __setitem__(self, index, weight):
+        self.__leaves[index] = weight
+        self.__stale.append(index)
+
+    def update(self, indices, weights):
+        self.__leaves[indices] = weights
+        self.__stale.extend(indices.tolist())
+
+    def refresh(self):
+        if self.__stale:
+            # a block written several times is summed several times, cheaper than deduplicating it
+            blocks = np.array(self.__stale, dtype=np.int64) // self.__block_size
+            self.__stale.clear()
+            self.__blocks[blocks] = self.__leaves.reshape(-1, self.__block_size)[blocks].sum(axis=1)
+
+    @property
+    def total(self):
+        self.refresh()
+        return float(self.__blocks.sum())
+
+    def find(self, values):
+        """
+        Return the leaves where the cumulative sums of the weights reach values, from 0 to total.
+        """
+        self.refresh()
+        block_sums = np.cumsum(self.__blocks)
+        blocks = np.minimum(np.searchsorted(block_sums, values, side='right'), len(self.__blocks) - 1)
+        values = values - (block_sums[blocks] - self.__blocks[blocks])
+        sums = self.__leaves.reshape(-1, self.__block_size)[blocks].cumsum(axis=1)
+        leaves = np.minimum((sums <= values[:, None]).sum(axis=1), self.__block_size - 1)
+        return blocks * self.__block_size + leaves
+
+
+class ReplayBuffer:
+    """
+    Last size transitions of an agent in preallocated NumPy columns. The observations already encode
+    the cell of the agent, the cell of its opponent and its last action (see StateEncoder).
+    Transitions are sampled uniformly, or with prioritized, in proportion to their last error
+    to the power alpha (kept in a SumTree), with the importance sampling weights of beta.
+    """
+
+    def __init__(self, size=REPLAY_SIZE, rng=None, prioritized=False, alpha=PRIORITY_ALPHA, beta=PRIORITY_BETA):
+        self.__rng = rng if rng is not None else np.random.default_rng()
+        self.__observations = np.zeros(size, dtype=np.int64)
+        self.__actions = np.zeros(size, dtype=np.int64)
+        self.__rewards = np.zeros(size, dtype=np.float64)
+        self.__next_observations = np.zeros(size, dtype=np.int64)
+        self.__dones = np.zeros(size, dtype=bool)
+        self.__priorities = SumTree(size) if prioritized else None
+        self.__max_priority = 1.0
+        self.__alpha = alpha
+        self.__beta = beta
+        # next slot written and number of transitions stored
+        self.__position = 0
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def add(self, observation, action, reward, next_observation, done=False):
+        i = self.__position
+        self.__observations[i] = observation
+        self.__actions[i] = action
+        self.__rewards[i] = reward
+        self.__next_observations[i] = next_observation
+        self.__dones[i] = done
+        if self.__priorities is not None:
+            # new transitions are sampled at least once before their error is known
+            self.__priorities[i] = self.__max_priority ** self.__alpha
+        self.__position = (i + 1) % len(self.__observations)
+        self.__count = min(self.__count + 1, len(self.__observations))
+
+    # The last transition ends the match, its next observation is not worth anything
+    def mark_done(self):
+        if self.__count:
+            self.__dones[self.__position - 1] = True
+
+    def sample(self, batch_size):
+        """
+        Return the indices of batch_size transitions and their importance sampling weights
+        (None when sampling uniformly).
+        """
+        if self.__priorities is None:
+            return self.__rng.integers(0, self.__count, batch_size), None
+        priorities = self.__priorities
+        total = priorities.total
+        # rounding can reach the empty leaves after the last transition
+        indices = np.minimum(priorities.find(self.__rng.random(batch_size) * total), self.__count - 1)
+        weights = (self.__count * priorities[indices] / total) ** -self.__beta
+        return indices, weights / weights.max()
+
+    def update_priorities(self, indices, errors):
+        if self.__priorities is not None:
+            priorities = np.abs(errors) + 1e-6
+            self.__priorities.update(indices, priorities ** self.__alpha)
+            self.__max_priority = max(self.__max_priority, float(priorities.max()))
+
+    @property
+    def rng(self):
+        return self.__rng
+
+    @property
+    def prioritized(self):
+        return self.__priorities is not None
+
+    @property
+    def observations(self):
+        return self.__observations
+
+    @property
+    def actions(self):
+        return self.__actions
+
+    @property
+    def rewards(self):
+        return self.__rewards
+
+    @property
+    def next_observations(self):
+        return self.__next_observations
+
+    @property
+    def dones(self):
+        return self.__dones
@@ -0,0 +1,52 @@
+# Random generators of a run, all derived from one seed
+import json
+import os
+import random
+import threading
+
+import numpy as np
+
+
+def seed_sequence(seed=None):
+    """
+    SeedSequence of a run. Without a seed, a new one is drawn so that it can still be logged.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(63)
+    return np.random.SeedSequence(seed)
+
+
+def agent_rngs(sequence, count):
+    """
+    One independent random.Random per agent, for the action selection.
+    """
+    return [random.Random(int(child.generate_state(2, np.uint32).view(np.uint64)[0]))
+            for child in sequence.spawn(count)]
+
+
+# JSON serializable state of the generators
+def rng_state(rngs):
+    return [{'version': version, 'internal': list(internal), 'gauss': gauss}
+            for version, internal, gauss in (rng.getstate() for rng in rngs)]
+
+
+def restore_rng_state(rngs, state):
+    for rng, rng_data in zip(rngs, state):
+        rng.setstate((rng_data['version'], tuple(rng_data['internal']), rng_data['gauss']))
+
+
+def write_rng_state(file_name, state):
+    """
+    Replace the JSON file of the generators state, like the qtable files.
+    """
+    temp_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file_name, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_file_name, file_name)
+
+
+def read_rng_state(file_name):
+    with open(file_name) as f:
+        return json.load(f)
@@ -0,0 +1,161 @@
+# Scores of every generation, streamed to disk
+import os
+
+from Environment import SCORE_HISTORY_SIZE
+
+
+class ScoreHistory:
+    """
+    Bounded history of the scores for the live display. Once full, every two neighbour
+    points are averaged into one, so the history always covers all the generations with
+    at most size points, each the mean of stride generations.
+    """
+
+    def __init__(self, size=SCORE_HISTORY_SIZE):
+        self.__size = size
+        self.__stride = 1
+        self.__generations = []
+        self.__scores = []
+        # generations waiting to fill the next point
+        self.__pending = []
+
+    def append(self, generation, scores):
+        self.__pending.append((generation, scores))
+        if len(self.__pending) < self.__stride:
+            return
+        self.__generations.append(self.__pending[0][0])
+        self.__scores.append([sum(s[i] for _, s in self.__pending) / len(self.__pending)
+                              for i in range(len(scores))])
+        self.__pending = []
+        if len(self.__generations) >= self.__size:
+            self.__generations = self.__generations[::2]
+            self.__scores = [[(a + b) / 2 for a, b in zip(first, second)]
+                             for first, second in zip(self.__scores[::2], self.__scores[1::2])]
+            self.__generations = self.__generations[:len(self.__scores)]
+            self.__stride *= 2
+
+    @property
+    def generations(self):
+        return self.__generations
+
+    # scores[agent] along the generations
+    @property
+    def scores(self):
+        return [list(agent_scores) for agent_scores in zip(*self.__scores)]
+
+    @property
+    def stride(self):
+        return self.__stride
+
+
+class ScoreLog:
+    """
+    Append-only CSV log of the scores of the agents at every generation, flushed at each
+    generation so that a stopped run keeps its history. A log which already exists is
+    continued after its last generation. Only a downsampled ScoreHistory stays in memory.
+    """
+
+    def __init__(self, file_name=None, history_size=SCORE_HISTORY_SIZE):
+        self.__file_name = file_name
+        self.__file = None
+        self.__header = True
+        self.__history = ScoreHistory(history_size)
+        self.__generation = 0
+        # exact sums for the mean scores of the run
+        self.__totals = None
+        self.__count = 0
+        if file_name is not None:
+            self.__generation = last_generation(file_name) + 1
+            # the header is written with the first scores of a new log
+            self.__header = os.path.isfile(file_name) and os.path.getsize(file_name) > 0
+            self.__file = open(file_name, 'a')
+            if self.__header and not ends_with_newline(file_name):
+                # the line the last run was writing when it stopped is left alone
+                self.__file.write('\n')
+
+    def append(self, scores):
+        """
+        Log the scores of the agents for the next generation and return its number.
+        """
+        generation = self.__generation
+        if self.__file is not None:
+            if not self.__header:
+                self.__file.write(','.join(['generation'] + [f'score_{i}' for i in range(len(scores))]) + '\n')
+                self.__header = True
+            self.__file.write(','.join(map(str, [generation] + list(scores))) + '\n')
+            self.__file.flush()
+        self.__history.append(generation, scores)
+        if self.__totals is None:
+            self.__totals = [0] * len(scores)
+        self.__totals = [total + score for total, score in zip(self.__totals, scores)]
+        self.__count += 1
+        self.__generation += 1
+        return generation
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    @property
+    def file_name(self):
+        return self.__file_name
+
+    @property
+    def history(self):
+        return self.__history
+
+    # mean score of every agent over the generations logged by this run
+    @property
+    def mean_scores(self):
+        if not self.__count:
+            return []
+        return [total / self.__count for total in self.__totals]
+
+
+def last_generation(file_name):
+    """
+    Number of the last generation of a score log, -1 if it has none.
+    """
+    if not os.path.isfile(file_name):
+        return -1
+    with open(file_name, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        data = f.read()
+    lines = [line for line in data[:data.rfind(b'\n') + 1].split(b'\n')
+             if line and not line.startswith(b'generation')]
+    if not lines:
+        return -1
+    return int(lines[-1].split(b',')[0])
+
+
+def ends_with_newline(file_name):
+    with open(file_name, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def read_scores(file_name, offset=0):
+    """
+    Read the generations logged after offset, return (generations, scores per generation, new offset).
+    A line still being written is left for the next call.
+    """
+    generations = []
+    scores = []
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].split(b'\n'):
+        if not line or line.startswith(b'generation'):
+            continue
+        try:
+            values = line.decode('ascii').split(',')
+            generation, generation_scores = int(values[0]), [float(value) for value in values[1:]]
+        except ValueError:
+            # line cut by a run which stopped while writing it
+            continue
+        generations.append(generation)
+        scores.append(generation_scores)
+    return generations, scores, offset + end
@@ -0,0 +1,88 @@
+import numpy as np
+
+from Environment import ACTIONS, MAX_HP, HEALTH_BUCKETS
+
+
+class StateEncoder:
+    """
+    Map the observation of an agent, (own cell, opponent cell, opponent last action) and
+    optionally the health bucket of both players, to a single integer.
+    Cells are the indices of the arena states and actions the indices in the action list,
+    len(actions) standing for no last action.
+    """
+
+    def __init__(self, states, actions=ACTIONS, health_buckets=HEALTH_BUCKETS, max_health=MAX_HP):
+        self.__cells = [tuple(state) for state in states]
+        self.__cell_indices = {state: i for i, state in enumerate(self.__cells)}
+        self.__actions = list(actions)
+        self.__action_indices = {action: i for i, action in enumerate(self.__actions)}
+        self.__health_buckets = health_buckets
+        self.__max_health = max_health
+        # the last slot of the opponent actions is the missing last action
+        self.__no_action = len(self.__actions)
+        self.__observations = len(self.__cells) ** 2 * (len(self.__actions) + 1) * health_buckets ** 2
+
+    def encode(self, cell, opponent_cell, opponent_action, health=None, opponent_health=None):
+        """
+        Encode one observation, or arrays of observations.
+        The health is only used with more than one health bucket.
+        """
+        observation = (cell * len(self.__cells) + opponent_cell) * (self.__no_action + 1) + opponent_action
+        if self.__health_buckets > 1:
+            observation = observation * self.__health_buckets + self.health_bucket(health)
+            observation = observation * self.__health_buckets + self.health_bucket(opponent_health)
+        return observation
+
+    def decode(self, observation):
+        """
+        Return (cell, opponent cell, opponent action, health bucket, opponent health bucket).
+        """
+        opponent_health_bucket = observation % self.__health_buckets
+        observation //= self.__health_buckets
+        health_bucket = observation % self.__health_buckets
+        observation //= self.__health_buckets
+        opponent_action = observation % (self.__no_action + 1)
+        observation //= self.__no_action + 1
+        return (observation // len(self.__cells), observation % len(self.__cells), opponent_action,
+                health_bucket, opponent_health_bucket)
+
+    def health_bucket(self, health):
+        if isinstance(health, np.ndarray):
+            return np.clip(health, 0, self.__max_health) * self.__health_buckets // (self.__max_health + 1)
+        return max(0, min(health, self.__max_health)) * self.__health_buckets // (self.__max_health + 1)
+
+    def cell_index(self, state):
+        return self.__cell_indices[state]
+
+    def action_index(self, action):
+        if action is None:
+            return self.__no_action
+        return self.__action_indices[action]
+
+    def __eq__(self, other):
+        return (isinstance(other, StateEncoder) and self.__cells == other.cells and self.__actions == other.actions
+                and self.__health_buckets == other.health_buckets and self.__max_health == other.max_health)
+
+    @property
+    def cells(self):
+        return self.__cells
+
+    @property
+    def actions(self):
+        return self.__actions
+
+    @property
+    def no_action(self):
+        return self.__no_action
+
+    @property
+    def health_buckets(self):
+        return self.__health_buckets
+
+    @property
+    def max_health(self):
+        return self.__max_health
+
+    @property
+    def observations(self):
+        return self.__observations
@@ -0,0 +1,278 @@
+# Headless training loop
+import argparse
+import os
+import time
+
+from AgentManager import AgentManager
+from Checkpoint import CheckpointWriter
+from Learner import LEARNERS, ExponentialEpsilon, learner_factory
+from Metrics import Metrics, sink_for_file
+from Replay import EpisodeRecorder
+from Rng import seed_sequence, agent_rngs, rng_state, restore_rng_state, read_rng_state
+from ScoreLog import ScoreLog
+from GameEnvironement import *
+
+
+class Trainer:
+    """
+    Drive the GameEnvironment and the AgentManager without any arcade window.
+    The GUI uses the same trainer to advance one step per frame and draws the agents.
+    Every random generator of the run is derived from seed, a new one is drawn without it.
+    The agents resume the qtables saved under qtable_path; with None they start from empty
+    qtables (to be replaced through qtables) and nothing is checkpointed.
+    """
+
+    def __init__(self, arena=ARENA, learning=True, max_iterations=MAX_ITERATIONS,
+                 save_every=SAVE_EVERY, qtable_path=QTABLE_PATH, sparse=None, health_buckets=HEALTH_BUCKETS,
+                 metrics=None, score_log_path=None, seed=None, record_path=None, record_every=RECORD_EVERY,
+                 learner=None):
+        self.__seed_sequence = seed_sequence(seed)
+        self.__rngs = agent_rngs(self.__seed_sequence, 2)
+        self.__environment = GameEnvironment(arena, health_buckets)
+        # phase times and per-generation aggregates, only measured with a Metrics
+        self.__metrics = metrics
+        self.__environment.metrics = metrics
+        self.__agent_manager = AgentManager(self.__environment, 2, MAX_HP, learning, sparse, self.__rngs, learner,
+                                            qtable_path)
+        self.__learning = learning
+        # None means a generation only ends when one agent is dead
+        self.__max_iterations = max_iterations
+        self.__qtable_path = qtable_path
+        self.__generation_counter = 0
+        self.__iteration_counter = 0
+        # qtables are saved in the background every save_every generations
+        self.__checkpoint_writer = None
+        # scores of every generation, written to score_log_path if given
+        self.__score_log = ScoreLog(score_log_path)
+        if learning and save_every and qtable_path is not None:
+            self.__checkpoint_writer = CheckpointWriter(
+                [file_name for i, learner in enumerate(self.__agent_manager.learners)
+                 for file_name in learner.file_names(f"{qtable_path}{i}")], save_every, self.rng_file_name)
+        # one match every record_every generations is appended to the episode log record_path
+        self.__recorder = None
+        if record_path is not None:
+            self.__recorder = EpisodeRecorder(record_path, arena, self.__environment.encoder.cells, record_every,
+                                            self.seed, self.__environment.encoder.health_buckets)
+            self.__recorder.begin(self.__generation_counter, self.__agent_manager.agents)
+
+    # Best action then apply it for each alive agent
+    def step(self):
+        metrics = self.__metrics
+        recorder = self.__recorder
+        actions = None
+        if metrics is None:
+            self.__agent_manager.best_actions()
+            if recorder is not None and recorder.recording:
+                actions = [agent.actual_action for agent in self.__agent_manager.agents]
+            self.__agent_manager.apply_actions(self.__agent_manager.get_alive_agents)
+        else:
+            start = time.perf_counter()
+            self.__agent_manager.best_actions()
+            if recorder is not None and recorder.recording:
+                actions = [agent.actual_action for agent in self.__agent_manager.agents]
+            selected = time.perf_counter()
+            update_time = metrics.time('update')
+            self.__agent_manager.apply_actions(self.__agent_manager.get_alive_agents)
+            # the qtable updates are timed inside apply
+            metrics.add_time('select', selected - start)
+            metrics.add_time('apply', time.perf_counter() - selected - (metrics.time('update') - update_time))
+        if actions is not None:
+            recorder.record_step(actions, self.__agent_manager.agents)
+        self.__iteration_counter += 1
+
+    @property
+    def is_generation_over(self):
+        if self.__agent_manager.goal:
+            return True
+        return self.__max_iterations is not None and self.__iteration_counter >= self.__max_iterations
+
+    def end_generation(self):
+        self.__score_log.append([agent.score for agent in self.__agent_manager.agents])
+        if self.__metrics is not None:
+            self.__metrics.record_agents(self.__agent_manager.agents)
+        if self.__recorder is not None:
+            self.__recorder.end()
+        self.__agent_manager.reset()
+        self.__generation_counter += 1
+        if self.__recorder is not None:
+            self.__recorder.begin(self.__generation_counter, self.__agent_manager.agents)
+        if self.__checkpoint_writer is not None:
+            start = time.perf_counter()
+            self.__checkpoint_writer.checkpoint(self.saved_qtables, self.__generation_counter, self.rng_state())
+            if self.__metrics is not None:
+                self.__metrics.add_time('checkpoint', time.perf_counter() - start)
+        if self.__metrics is not None:
+            self.__metrics.end_generation(self.__generation_counter - 1, self.__iteration_counter)
+        self.__iteration_counter = 0
+
+    def run_generation(self):
+        while not self.is_generation_over:
+            self.step()
+        self.end_generation()
+
+    def train(self, generations):
+        for _ in range(generations):
+            self.run_generation()
+
+    def save_qtables(self):
+        agents = self.__agent_manager.agents
+        for i in range(len(agents)):
+            agents[i].save_qtable(f"{self.__qtable_path}{i}")
+
+    # State of the agent generators and of the NumPy generators of their learners, saved with
+    # the checkpoints to resume the same run
+    def rng_state(self):
+        state = rng_state(self.__rngs)
+        for agent_state, learner in zip(state, self.__agent_manager.learners):
+            if learner.numpy_rng is not None:
+                agent_state['numpy'] = learner.numpy_rng.bit_generator.state
+        return state
+
+    def restore_rng_state(self, state=None):
+        """
+        Restore the agent generators, and the NumPy generators of their learners, from a state or
+        from the last checkpoint if it exists. The replay buffers are not saved and start empty.
+        Return True if they were restored.
+        """
+        if state is None:
+            if self.rng_file_name is None or not os.path.exists(self.rng_file_name):
+                return False
+            state = read_rng_state(self.rng_file_name)
+        restore_rng_state(self.__rngs, state)
+        for agent_state, learner in zip(state, self.__agent_manager.learners):
+            if learner.numpy_rng is not None and 'numpy' in agent_state:
+                learner.numpy_rng.bit_generator.state = agent_state['numpy']
+        return True
+
+    # Write the last checkpoint and stop the checkpoint writer
+    def close(self):
+        if self.__checkpoint_writer is not None:
+            self.__checkpoint_writer.close(self.saved_qtables, self.rng_state())
+            self.__checkpoint_writer = None
+        if self.__metrics is not None:
+            self.__metrics.close()
+        self.__score_log.close()
+        if self.__recorder is not None:
+            self.__recorder.close()
+            self.__recorder = None
+
+    def _get_qtables(self):
+        return [agent.qtable for agent in self.__agent_manager.agents]
+
+    def _set_qtables(self, qtables):
+        # the next agents keep the qtables of the current ones
+        for agent, qtable in zip(self.__agent_manager.agents, qtables):
+            agent.qtable = qtable
+
+    qtables = property(_get_qtables, _set_qtables)
+
+    # the qtables of the agents and the other qtables of their learners, in the order of the checkpoint files
+    @property
+    def saved_qtables(self):
+        return [qtable for learner in self.__agent_manager.learners for qtable in learner.qtables]
+
+    # seed every generator of the run is derived from
+    @property
+    def seed(self):
+        return self.__seed_sequence.entropy
+
+    @property
+    def rng_file_name(self):
+        if self.__qtable_path is None:
+            return None
+        return f"{self.__qtable_path}rng.json"
+
+    @property
+    def score_log(self):
+        return self.__score_log
+
+    @property
+    def metrics(self):
+        return self.__metrics
+
+    @property
+    def environment(self):
+        return self.__environment
+
+    @property
+    def agent_manager(self):
+        return self.__agent_manager
+
+    @property
+    def generation_counter(self):
+        return self.__generation_counter
+
+    @property
+    def iteration_counter(self):
+        return self.__iteration_counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the agents without opening the game window.")
+    parser.add_argument("-g", "--generations", type=int, default=1000, help="number of generations to train")
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS,
+                        help="iterations after which a generation is stopped (0 for no limit)")
+    parser.add_argument("--save-every", type=int, default=SAVE_EVERY,
+                        help="save the qtables in the background every N generations (0 to only save at the end)")
+    parser.add_argument("--qtable-path", default=QTABLE_PATH, help="prefix of the saved qtable files")
+    parser.add_argument("--sparse", action="store_true",
+                        help="only store the qtable values the agents visit (default for the large arenas)")
+    parser.add_argument("--score-log", default=SCORE_LOG_PATH,
+                        help="CSV file the scores of every generation are appended to")
+    parser.add_argument("--record", help="append one match every --record-every generations to this episode log")
+    parser.add_argument("--record-every", type=int, default=RECORD_EVERY, help="generations between two recorded matches")
+    parser.add_argument("--seed", type=int, help="seed of the random generators (a new one is printed without it)")
+    parser.add_argument("--restore-rng", action="store_true",
+                        help="resume the random generators saved with the last checkpoint")
+    parser.add_argument("--metrics", help="write the metrics of every generation to this .jsonl or .csv file")
+    parser.add_argument("--learner", choices=sorted(LEARNERS), default=LEARNER, help="learning algorithm of the agents")
+    parser.add_argument("--learning-rate", type=float, default=LEARNING_RATE)
+    parser.add_argument("--discount-factor", type=float, default=DISCOUNT_FACTOR)
+    parser.add_argument("--exploration-decay", type=float, default=EXPLORATION_DECAY,
+                        help="factor applied to the exploration each time an agent explores")
+    parser.add_argument("--min-exploration", type=float, default=MIN_EXPLORATION)
+    parser.add_argument("--explore-ties-only", action="store_true",
+                        help="only play an explored action as good as the greedy one, as the first versions did")
+    parser.add_argument("--trace-decay", type=float, default=TRACE_DECAY, help="lambda of the qlambda learner")
+    parser.add_argument("--trace-length", type=int, default=TRACE_LENGTH,
+                        help="eligibility traces kept by the qlambda learner")
+    parser.add_argument("--replay-size", type=int, default=REPLAY_SIZE, help="transitions kept by the replay learner")
+    parser.add_argument("--replay-batch", type=int, default=REPLAY_BATCH, help="minibatch size of the replay learner")
+    parser.add_argument("--prioritized", action="store_true", help="prioritized sampling for the replay learner")
+    parser.add_argument("--health-buckets", type=int, default=HEALTH_BUCKETS,
+                        help="health levels of each player the agents observe (1 to ignore the health)")
+    args = parser.parse_args()
+
+    metrics = Metrics([sink_for_file(args.metrics)]) if args.metrics else None
+    learner_options = {}
+    if args.learner == 'qlambda':
+        learner_options = {'trace_decay': args.trace_decay, 'trace_length': args.trace_length}
+    elif args.learner == 'replay':
+        learner_options = {'replay_size': args.replay_size, 'batch_size': args.replay_batch,
+                           'prioritized': args.prioritized}
+    learner = learner_factory(args.learner, lambda: ExponentialEpsilon(decay=args.exploration_decay,
+                                                                       minimum=args.min_exploration),
+                              learning_rate=args.learning_rate, discount_factor=args.discount_factor,
+                              explore_ties_only=args.explore_ties_only, **learner_options)
+    trainer = Trainer(max_iterations=args.max_iterations or None, save_every=args.save_every,
+                      qtable_path=args.qtable_path, sparse=args.sparse or None, health_buckets=args.health_buckets,
+                      metrics=metrics, score_log_path=args.score_log, seed=args.seed, record_path=args.record,
+                      record_every=args.record_every, learner=learner)
+    if args.restore_rng and not trainer.restore_rng_state():
+        print(f"no random generators state in {trainer.rng_file_name}")
+    print(f"seed: {trainer.seed}")
+    start = time.perf_counter()
+    trainer.train(args.generations)
+    elapsed = time.perf_counter() - start
+    if not args.save_every:
+        trainer.save_qtables()
+    trainer.close()
+    print(f"{args.generations} generations in {elapsed:.2f}s "
+          f"({args.generations / elapsed:.1f} generations/s)")
+    for i, qtable in enumerate(trainer.qtables):
+        if hasattr(qtable, 'occupancy'):
+            print(f"qtable {i} occupancy: {qtable.occupancy()}")
+
+
+if __name__ == "__main__":
+    main()
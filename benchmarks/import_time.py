@@ -0,0 +1,56 @@
+# Import time of the modules, each measured in a fresh interpreter
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['QTable', 'AgentLogic', 'Trainer', 'ParallelTrainer', 'BatchEnvironment', 'Agent', 'Main']
+HEAVY_MODULES = ['numpy', 'arcade', 'pyglet', 'matplotlib']
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(module, repeat):
+    times = []
+    heavy = ''
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            return {'module': module, 'error': result.stderr.strip().splitlines()[-1]}
+        elapsed, heavy = result.stdout.split()[0], ''.join(result.stdout.split()[1:])
+        times.append(float(elapsed) * 1000)
+    return {'module': module, 'median_ms': statistics.median(times), 'min_ms': min(times),
+            'imports': heavy.split(',') if heavy else []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the modules.")
+    parser.add_argument('modules', nargs='*', default=MODULES, help="modules to import")
+    parser.add_argument('-n', '--repeat', type=int, default=5, help="imports measured per module")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    for result in results:
+        if 'error' in result:
+            print(f"{result['module']:<20} failed: {result['error']}")
+        else:
+            print(f"{result['module']:<20} {result['median_ms']:8.1f} ms  imports {', '.join(result['imports'])}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
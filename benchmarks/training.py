@@ -0,0 +1,180 @@
+# Speed of the training loop on several arena sizes, each measured in a fresh interpreter
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (width, rows) of the benchmarked arenas, the first one is the default ARENA
+ARENAS = [(16, 1), (32, 1), (64, 1), (128, 1), (32, 4)]
+
+
+def make_arena(width, rows):
+    lines = [list('#' + ' ' * (width - 2) + '#') for _ in range(rows)]
+    lines[0][3] = '*'
+    lines[0][width - 7] = '*'
+    return '\n'.join(''.join(line) for line in lines)
+
+
+def rate(function, duration):
+    """
+    Call function until duration seconds are spent, return the calls per second.
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        for _ in range(100):
+            function()
+        calls += 100
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def run_case(width, rows, duration, generations):
+    # the trainers resume from an empty directory, never from the qtables saved by a previous training
+    with tempfile.TemporaryDirectory() as directory:
+        return measure_case(width, rows, duration, generations, os.path.join(directory, 'agent_'))
+
+
+def measure_case(width, rows, duration, generations, qtable_path):
+    sys.path.insert(0, ROOT)
+    from Environment import BLOCK, LEFT, RIGHT, MAX_HP, PUNCH
+    from AgentLogic import AgentLogic
+    from GameEnvironement import GameEnvironment
+    from QTable import QTable
+    from Trainer import Trainer
+
+    arena = make_arena(width, rows)
+    random.seed(0)
+    result = {'arena': f"{width}x{rows}", 'cells': width * rows}
+
+    start = time.perf_counter()
+    environment = GameEnvironment(arena)
+    result['environment_ms'] = (time.perf_counter() - start) * 1000
+    result['observations'] = environment.encoder.observations
+
+    def construct():
+        AgentLogic(environment, MAX_HP, environment.players_pos[0], QTable.from_environment(environment, False), 0)
+    result['construct_per_s'] = rate(construct, duration)
+
+    trainer = Trainer(arena, max_iterations=None, save_every=0, qtable_path=qtable_path, sparse=False, seed=0)
+    agent, opponent = trainer.agent_manager.agents
+    trainer.step()
+
+    result['best_action_per_s'] = rate(lambda: agent.best_action(opponent), duration)
+
+    def update():
+        agent.update_ia(PUNCH, agent.cell, opponent, -1)
+    result['update_ia_per_s'] = rate(update, duration)
+
+    moves = [RIGHT, LEFT, BLOCK]
+
+    def apply():
+        agent.actual_action = moves[random.randrange(len(moves))]
+        trainer.environment.apply(agent, opponent)
+    result['apply_per_s'] = rate(apply, duration)
+
+    trainer = Trainer(arena, max_iterations=1000, save_every=0, qtable_path=qtable_path, sparse=False, seed=0)
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(generations):
+        while not trainer.is_generation_over:
+            trainer.step()
+            steps += 1
+        trainer.end_generation()
+    elapsed = time.perf_counter() - start
+    result['steps_per_s'] = steps / elapsed
+    result['generations_per_s'] = generations / elapsed
+    result['mean_generation_length'] = steps / generations
+
+    qtable = trainer.qtables[0]
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'agent.qtable')
+        start = time.perf_counter()
+        qtable.save(file_name)
+        result['save_ms'] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        QTable.load(file_name)
+        result['load_mmap_ms'] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        QTable.load(file_name, mmap_mode=None)
+        result['load_ms'] = (time.perf_counter() - start) * 1000
+    result['qtable_bytes'] = qtable.nbytes
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return result
+
+
+def measure(width, rows, duration, generations):
+    command = [sys.executable, os.path.abspath(__file__), '--case', str(width), str(rows),
+               '--duration', str(duration), '--generations', str(generations)]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'arena': f"{width}x{rows}", 'error': result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def compare(results, file_name):
+    """
+    Print the ratio of every rate to the one of a previous run, below 1 is slower.
+    """
+    with open(file_name) as f:
+        previous = {result['arena']: result for result in json.load(f)['results']}
+    print(f"\ncompared to {file_name}:")
+    for result in results:
+        old = previous.get(result['arena'])
+        if old is None or 'error' in result or 'error' in old:
+            continue
+        ratios = [f"{key[:-len('_per_s')]} x{result[key] / old[key]:.2f}"
+                  for key in result if key.endswith('_per_s') and old.get(key)]
+        print(f"{result['arena']:<8} {'  '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the speed of the training loop.")
+    parser.add_argument('arenas', nargs='*', help="arenas as WIDTHxROWS (default: several sizes)")
+    parser.add_argument('--duration', type=float, default=0.5, help="seconds spent on every micro benchmark")
+    parser.add_argument('--generations', type=int, default=50, help="generations of the full training benchmark")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results of a previous run to compare with")
+    parser.add_argument('--case', nargs=2, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(*args.case, args.duration, args.generations)))
+        return
+
+    arenas = [tuple(map(int, arena.split('x'))) for arena in args.arenas] or ARENAS
+    results = [measure(width, rows, args.duration, args.generations) for width, rows in arenas]
+    for result in results:
+        if 'error' in result:
+            print(f"{result['arena']:<8} failed: {result['error']}")
+        else:
+            print(f"{result['arena']:<8} {result['steps_per_s']:10.0f} steps/s {result['generations_per_s']:8.1f} gen/s"
+                  f"  best_action {result['best_action_per_s']:8.0f}/s  update_ia {result['update_ia_per_s']:8.0f}/s"
+                  f"  apply {result['apply_per_s']:8.0f}/s  save {result['save_ms']:6.1f} ms"
+                  f"  peak {result['peak_rss_mb']:6.1f} MB")
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': git_commit(), 'python': platform.python_version(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()